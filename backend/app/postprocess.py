@@ -0,0 +1,359 @@
+"""
+Shared post-processing for segmentation endpoints.
+
+Turns masks returned by SAM / SAM3 into GeoJSON features: bbox and area,
+thumbnail, mask → polygon, pixel → geographic coordinates and feature ids.
+"""
+
+import asyncio
+import base64
+import logging
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from models.coordinate_converter import CoordinateConverter
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on threads used to post-process results (polygon/thumbnail/geo)
+POSTPROCESS_MAX_WORKERS = int(os.environ.get("POSTPROCESS_MAX_WORKERS", "8"))
+
+
+def as_bool_mask(mask: np.ndarray) -> np.ndarray:
+    """
+    Normalize a segmentation mask to bool once, avoiding copies where possible.
+
+    bool masks are returned unchanged and uint8 masks are reinterpreted as bool
+    via a zero-copy view (any non-zero byte reads as True); other dtypes fall
+    back to astype(bool).
+    """
+    if mask.dtype == np.bool_:
+        return mask
+    if mask.dtype == np.uint8:
+        return mask.view(np.bool_)
+    return mask.astype(bool)
+
+
+def mask_stats(mask: np.ndarray) -> Optional[Tuple[int, int, int, int, int]]:
+    """
+    Compute bounding box and pixel area of a mask without index arrays.
+
+    The bool mask is handed to OpenCV as a zero-copy uint8 view;
+    boundingRect and countNonZero are SIMD loops, several times faster
+    than np.where or axis projections.
+
+    Returns:
+        (x1, y1, x2, y2, pixel_area), or None if the mask is empty
+    """
+    m = as_bool_mask(mask).view(np.uint8)
+    x, y, w, h = cv2.boundingRect(m)
+    if w == 0 or h == 0:
+        return None
+    return x, y, x + w - 1, y + h - 1, cv2.countNonZero(m)
+
+
+# WebP quality for object thumbnails
+THUMBNAIL_WEBP_PARAMS = [cv2.IMWRITE_WEBP_QUALITY, 80]
+
+
+def make_thumbnail(
+    image: np.ndarray,
+    bbox: List[int],
+    padding: int = 5,
+    size: int = 100
+) -> Optional[str]:
+    """
+    Crop the bbox region (plus padding) and encode it as a base64 WebP thumbnail.
+
+    The crop is a NumPy slice of the RGB array, shrunk with an INTER_AREA
+    box filter and encoded by cv2.imencode; all three release the GIL, so
+    thumbnails can be built concurrently in worker threads.
+
+    Returns:
+        Base64 string, or None if the thumbnail could not be generated
+    """
+    x1, y1, x2, y2 = bbox
+    x1 = max(0, x1 - padding)
+    y1 = max(0, y1 - padding)
+    x2 = min(image.shape[1], x2 + padding)
+    y2 = min(image.shape[0], y2 + padding)
+
+    try:
+        crop = image[y1:y2, x1:x2]
+        height, width = crop.shape[:2]
+        # Fit within size x size keeping the aspect ratio; never upscale
+        scale = min(1.0, size / max(width, height))
+        if scale < 1.0:
+            dsize = (max(1, round(width * scale)), max(1, round(height * scale)))
+            crop = cv2.resize(crop, dsize, interpolation=cv2.INTER_AREA)
+
+        ok, encoded = cv2.imencode(
+            '.webp', cv2.cvtColor(crop, cv2.COLOR_RGB2BGR), THUMBNAIL_WEBP_PARAMS
+        )
+        if not ok:
+            raise ValueError("WebP encoding failed")
+        return base64.b64encode(encoded).decode('ascii')
+    except Exception as e:
+        logger.warning("Failed to generate thumbnail: %s", e)
+        return None
+
+
+def bulk_uuid4(n: int) -> List[str]:
+    """Generate n random (version 4) UUID strings from a single os.urandom call."""
+    raw = os.urandom(16 * n)
+    return [str(uuid.UUID(bytes=raw[i * 16:(i + 1) * 16], version=4)) for i in range(n)]
+
+
+def close_rings(points: np.ndarray, offsets: np.ndarray) -> List[np.ndarray]:
+    """
+    Split concatenated ring vertices and close every open ring.
+
+    The start/end comparison is done for all rings at once instead of
+    one Python compare per polygon.
+
+    Args:
+        points: (N, 2) vertices of all rings, concatenated
+        offsets: ring boundaries into `points`, len(rings) + 1 entries
+
+    Returns:
+        List of closed (M, 2) rings
+    """
+    starts = points[offsets[:-1]]
+    ends = points[offsets[1:] - 1]
+    is_open = ~np.all(starts == ends, axis=1)
+    rings = np.split(points, offsets[1:-1])
+    return [
+        np.vstack([ring, ring[:1]]) if open_ring else ring
+        for ring, open_ring in zip(rings, is_open.tolist())
+    ]
+
+
+def polygons_to_geo_coords(converter: CoordinateConverter, polygons) -> List[list]:
+    """
+    Project pixel polygons to closed GeoJSON polygon coordinates.
+
+    All vertices go through a single vectorized pixels_to_geo call.
+
+    Rings stay (M, 2) float64 arrays; responses are rendered by orjson with
+    OPT_SERIALIZE_NUMPY, so there is no per-vertex tolist() round-trip.
+
+    Returns:
+        One GeoJSON "coordinates" value ([ring]) per input polygon
+    """
+    if not polygons:
+        return []
+    arrays = [np.asarray(polygon, dtype=np.float64).reshape(-1, 2) for polygon in polygons]
+    offsets = np.zeros(len(arrays) + 1, dtype=np.intp)
+    np.cumsum([len(a) for a in arrays], out=offsets[1:])
+    geo = converter.pixels_to_geo(np.concatenate(arrays))
+    return [[ring] for ring in close_rings(geo, offsets)]
+
+
+def unscale_bbox(bbox: Optional[List[int]], scale: float) -> Optional[List[int]]:
+    """Map a bbox from decoded image pixels back to original image pixels."""
+    if bbox is None or scale == 1.0:
+        return bbox
+    return [int(round(v / scale)) for v in bbox]
+
+
+def unscale_polygons(polygons, scale: float) -> list:
+    """Map pixel polygons from decoded image pixels back to original image pixels."""
+    if scale == 1.0:
+        return polygons
+    return [np.asarray(polygon, dtype=np.float64) / scale for polygon in polygons]
+
+
+def extract_result_confidence(result: dict) -> float:
+    """
+    Normalize confidence field across different SAM3 backends.
+    Some implementations return `score`, others return `confidence`.
+    """
+    value = result.get("confidence")
+    if value is None:
+        value = result.get("score")
+
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 1.0
+
+
+def build_result_features(
+    result: dict,
+    image: np.ndarray,
+    segmenter,
+    converter: Optional[CoordinateConverter],
+    class_name: str,
+    segmentation_mode: str,
+    min_confidence: Optional[float] = None,
+    min_size: Optional[int] = None,
+    max_size: Optional[int] = None,
+    max_polygons: Optional[int] = None,
+    scale: float = 1.0
+) -> List[dict]:
+    """
+    Turn one segmentation result into GeoJSON features (thumbnail, polygons, geo coords).
+
+    Feature ids are left as None so the caller can assign them in bulk.
+
+    Args:
+        result: Result dict with 'mask' and optional 'box'/'score'
+        image: Decoded RGB image array the mask refers to
+        segmenter: SAM/SAM3 backend providing mask_to_polygon
+        converter: Pixel→geo converter, or None to keep pixel coordinates
+        class_name: Value for the "class" property
+        segmentation_mode: Value for the "segmentation_mode" property
+        min_confidence / min_size / max_size: Optional filters, in decoded pixels
+        max_polygons: Keep only the first N (largest) polygons of the mask
+        scale: Decoded width / original width of the upload; pixel_area, bbox
+            and pixel polygons are reported in original image pixels
+
+    Returns:
+        List of features (empty if the result is filtered out or has no mask)
+    """
+    mask = result.get('mask')
+    if mask is None:
+        return []
+    mask = as_bool_mask(mask)
+    bbox = result.get('box')  # SAM3 may return bounding box
+
+    # One pass over the mask yields both pixel area and fallback bbox
+    stats = mask_stats(mask)
+    pixel_area = stats[4] if stats is not None else 0
+    confidence = extract_result_confidence(result)
+
+    if min_confidence is not None and confidence < min_confidence:
+        return []
+    if min_size is not None and pixel_area < min_size:
+        return []
+    if max_size is not None and pixel_area > max_size:
+        return []
+
+    bbox_list = None
+    if bbox is not None and len(bbox) == 4:
+        # Use provided bbox
+        x1, y1, x2, y2 = map(int, bbox)
+        bbox_list = [x1, y1, x2, y2]
+    elif stats is not None:
+        # Calculate bbox from mask
+        bbox_list = list(stats[:4])
+
+    # Generate thumbnail if we have bbox
+    thumbnail_b64 = make_thumbnail(image, bbox_list) if bbox_list else None
+
+    polygons = segmenter.mask_to_polygon(mask)
+    if max_polygons is not None:
+        polygons = polygons[:max_polygons]
+    if converter is not None:
+        polygon_coords = polygons_to_geo_coords(converter, polygons)
+    else:
+        polygon_coords = [[polygon] for polygon in unscale_polygons(polygons, scale)]
+
+    # Polygons of the same mask share one (read-only) properties dict
+    properties = {
+        "class": class_name,
+        "segmentation_mode": segmentation_mode,
+        "confidence": confidence,
+        "pixel_area": pixel_area if scale == 1.0 else int(round(pixel_area / (scale * scale))),
+        "bbox": unscale_bbox(bbox_list, scale),
+        "thumbnail": thumbnail_b64
+    }
+    return [
+        {
+            "type": "Feature",
+            "id": None,
+            "geometry": {"type": "Polygon", "coordinates": coords},
+            "properties": properties
+        }
+        for coords in polygon_coords
+    ]
+
+
+def build_batch_feature(
+    mask: np.ndarray,
+    image: np.ndarray,
+    segmenter,
+    converter: Optional[CoordinateConverter],
+    scale: float = 1.0
+) -> Optional[dict]:
+    """
+    Turn one batch-segmentation mask into a single GeoJSON feature.
+
+    Only the first polygon of the mask is kept. The feature id is left as
+    None so the caller can assign ids in bulk.
+
+    Args:
+        mask: Boolean object mask
+        image: Decoded RGB image array the mask refers to
+        segmenter: SAM backend providing mask_to_polygon
+        converter: Pixel→geo converter, or None to keep pixel coordinates
+        scale: Decoded width / original width of the upload; bbox and pixel
+            polygons are reported in original image pixels
+
+    Returns:
+        Feature dict, or None if no polygon was found
+    """
+    stats = mask_stats(mask)
+    bbox_list = list(stats[:4]) if stats is not None else None
+    thumbnail_b64 = make_thumbnail(image, bbox_list) if bbox_list else None
+
+    polygons = segmenter.mask_to_polygon(mask)
+    if not polygons:
+        return None
+
+    polygon = polygons[0]
+    if converter is not None:
+        coords = polygons_to_geo_coords(converter, [polygon])[0]
+    else:
+        coords = unscale_polygons([polygon], scale)
+
+    return {
+        "type": "Feature",
+        "id": None,
+        "geometry": {"type": "Polygon", "coordinates": coords},
+        "properties": {
+            "class": "manual",
+            "confidence": 1.0,
+            "segmentation_mode": "batch",
+            "bbox": unscale_bbox(bbox_list, scale),
+            "thumbnail": f"data:image/webp;base64,{thumbnail_b64}" if thumbnail_b64 else None
+        }
+    }
+
+
+def _build_features_sync(results: List[dict], **kwargs) -> List[dict]:
+    """
+    Build features for all segmentation results, fanning out over a thread pool.
+
+    Each result is independent and the heavy parts (OpenCV contours/WebP
+    encoding, NumPy projection) release the GIL, so threads scale. Result
+    order is preserved and feature ids are assigned in bulk at the end.
+    """
+    build = partial(build_result_features, **kwargs)
+    workers = min(POSTPROCESS_MAX_WORKERS, len(results))
+    if workers <= 1:
+        per_result = [build(result) for result in results]
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            per_result = list(executor.map(build, results))
+
+    features = [feature for result_features in per_result for feature in result_features]
+    for feature, feature_id in zip(features, bulk_uuid4(len(features))):
+        feature["id"] = feature_id
+    return features
+
+
+async def build_features(results: List[dict], **kwargs) -> List[dict]:
+    """
+    Build GeoJSON features for segmentation results off the event loop.
+
+    Keyword arguments are forwarded to build_result_features.
+    """
+    return await asyncio.to_thread(_build_features_sync, results, **kwargs)
+
@@ -24,6 +24,25 @@ REALTIME_MODEL = os.environ.get("REALTIME_MODEL", "gpt-realtime")
 
 logger = logging.getLogger(__name__)
 
+# Shared HTTP client, so session requests reuse the pooled TCP/TLS connection
+# to OpenAI instead of paying a new handshake every time.
+_http_client: httpx.AsyncClient | None = None
+
+
+def _get_http_client() -> httpx.AsyncClient:
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(trust_env=True, timeout=10.0)
+    return _http_client
+
+
+@router.on_event("shutdown")
+async def _close_http_client() -> None:
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
 
 def _build_openai_realtime_http_url() -> str:
     return f"{OPENAI_BASE_URL.rstrip('/')}/v1/realtime/sessions"
@@ -76,19 +95,18 @@ async def create_realtime_session():
         )
 
     try:
-        async with httpx.AsyncClient(trust_env=True) as client:
-            response = await client.post(
-                _build_openai_realtime_http_url(),
-                headers={
-                    "Authorization": f"Bearer {OPENAI_API_KEY}",
-                    "Content-Type": "application/json",
-                },
-                json={
-                    "model": REALTIME_MODEL,
-                    "voice": "alloy",
-                },
-                timeout=10.0,
-            )
+        response = await _get_http_client().post(
+            _build_openai_realtime_http_url(),
+            headers={
+                "Authorization": f"Bearer {OPENAI_API_KEY}",
+                "Content-Type": "application/json",
+            },
+            json={
+                "model": REALTIME_MODEL,
+                "voice": "alloy",
+            },
+            timeout=10.0,
+        )
     except httpx.RequestError as exc:
         raise HTTPException(
             status_code=502,
@@ -0,0 +1,54 @@
+# Contour helpers shared by the SAM / SAM3 segmenters
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+import cv2
+import numpy as np
+
+
+# Contour simplification is spread over a thread pool (cv2 releases the GIL)
+# once a mask has this many contours, e.g. a scene with hundreds of buildings
+PARALLEL_SIMPLIFY_MIN_CONTOURS = 256
+_simplify_workers = os.cpu_count() or 1
+_simplify_executor: Optional[ThreadPoolExecutor] = None
+_simplify_executor_lock = threading.Lock()
+
+
+def approx_contours(contours, tolerance: float) -> List[np.ndarray]:
+    """
+    Run cv2.approxPolyDP on every contour with at least 3 points.
+
+    Large contour sets are split into one contiguous chunk per CPU core so
+    each pool task simplifies many contours (per-contour tasks cost more in
+    scheduling than the simplification itself).
+
+    Args:
+        contours: cv2.findContours output
+        tolerance: Simplification tolerance in pixels
+
+    Returns:
+        Simplified contours, in input order
+    """
+    global _simplify_executor
+    contours = [c for c in contours if len(c) >= 3]  # Valid polygon needs at least 3 points
+    if len(contours) < PARALLEL_SIMPLIFY_MIN_CONTOURS or _simplify_workers < 2:
+        return [cv2.approxPolyDP(c, tolerance, True) for c in contours]
+
+    if _simplify_executor is None:
+        with _simplify_executor_lock:
+            if _simplify_executor is None:
+                _simplify_executor = ThreadPoolExecutor(
+                    max_workers=_simplify_workers, thread_name_prefix="simplify"
+                )
+
+    size = -(-len(contours) // _simplify_workers)
+    chunks = [contours[i:i + size] for i in range(0, len(contours), size)]
+    approx = []
+    for chunk in _simplify_executor.map(
+        lambda chunk: [cv2.approxPolyDP(c, tolerance, True) for c in chunk], chunks
+    ):
+        approx.extend(chunk)
+    return approx
@@ -1,6 +1,15 @@
+from functools import lru_cache
+from math import atan, degrees, exp, log, pi, radians, tan
 from typing import List, Tuple, Dict
 import numpy as np
 
+# Optional: numba JIT kernel for the corners mode; NumPy is used without it
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
 
 WEB_MERCATOR_MAX_LAT = 85.05112878
 
@@ -9,13 +18,48 @@ def _clamp_lat(lat: float) -> float:
     return max(min(lat, WEB_MERCATOR_MAX_LAT), -WEB_MERCATOR_MAX_LAT)
 
 
+# Scalar helpers use the math module (no NumPy scalar dispatch). The forward
+# helper is memoized, since converters are rebuilt per request with the same
+# bounds; the inverse sees arbitrary pixel-derived values, so it is not cached.
+@lru_cache(maxsize=1024)
 def _lat_to_mercator_y(lat: float) -> float:
-    lat_rad = np.radians(_clamp_lat(lat))
-    return float(np.log(np.tan(np.pi / 4.0 + lat_rad / 2.0)))
+    lat_rad = radians(_clamp_lat(lat))
+    return log(tan(pi / 4.0 + lat_rad / 2.0))
 
 
 def _mercator_y_to_lat(y: float) -> float:
-    return float(np.degrees(2.0 * np.arctan(np.exp(y)) - np.pi / 2.0))
+    return degrees(2.0 * atan(exp(y)) - pi / 2.0)
+
+
+if NUMBA_AVAILABLE:
+    # Single-threaded kernel: callers already convert features in worker
+    # threads, and numba's workqueue layer aborts the process on concurrent
+    # parallel entry. The fused loop (no temporaries) still beats the NumPy
+    # expression chain at every size.
+    @njit(nogil=True, fastmath=True, cache=True)
+    def _bilinear_to_geo(xs, ys, inv_w, inv_h,
+                         tlx, tly, trx, try_, brx, bry, blx, bly, out):
+        """Bilinear corner interpolation in Web Mercator space -> (lng, lat) rows of ``out``."""
+        for i in range(xs.shape[0]):
+            u = xs[i] * inv_w
+            v = ys[i] * inv_h
+            w_tl = (1.0 - u) * (1.0 - v)
+            w_tr = u * (1.0 - v)
+            w_br = u * v
+            w_bl = (1.0 - u) * v
+            mercator_x = w_tl * tlx + w_tr * trx + w_br * brx + w_bl * blx
+            mercator_y = w_tl * tly + w_tr * try_ + w_br * bry + w_bl * bly
+            out[i, 0] = degrees(mercator_x)
+            out[i, 1] = degrees(2.0 * atan(exp(mercator_y)) - pi / 2.0)
+
+
+def warmup_kernels() -> None:
+    """Compile (or load from cache) the numba kernel so no request pays the JIT cost."""
+    if not NUMBA_AVAILABLE:
+        return
+    xs = np.zeros(1, dtype=np.float64)
+    out = np.empty((1, 2), dtype=np.float64)
+    _bilinear_to_geo(xs, xs, 1.0, 1.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, out)
 
 
 class CoordinateConverter:
@@ -44,24 +88,12 @@ class CoordinateConverter:
             br = self.corners["bottom_right"]
             bl = self.corners["bottom_left"]
 
-            self._corner_mercator = {
-                "top_left": (
-                    float(np.radians(tl["lng"])),
-                    _lat_to_mercator_y(tl["lat"]),
-                ),
-                "top_right": (
-                    float(np.radians(tr["lng"])),
-                    _lat_to_mercator_y(tr["lat"]),
-                ),
-                "bottom_right": (
-                    float(np.radians(br["lng"])),
-                    _lat_to_mercator_y(br["lat"]),
-                ),
-                "bottom_left": (
-                    float(np.radians(bl["lng"])),
-                    _lat_to_mercator_y(bl["lat"]),
-                ),
-            }
+            # Corner positions in Web Mercator space, kept as plain float
+            # attributes (no dict lookups / tuple unpacking per conversion)
+            self._tlx, self._tly = radians(tl["lng"]), _lat_to_mercator_y(tl["lat"])
+            self._trx, self._try = radians(tr["lng"]), _lat_to_mercator_y(tr["lat"])
+            self._brx, self._bry = radians(br["lng"]), _lat_to_mercator_y(br["lat"])
+            self._blx, self._bly = radians(bl["lng"]), _lat_to_mercator_y(bl["lat"])
             self._mode = "corners"
         else:
             self.west = float(image_bounds['west'])
@@ -71,8 +103,8 @@ class CoordinateConverter:
 
             # Mapbox uses Web Mercator (EPSG:3857), so y/latitude mapping is non-linear.
             # We interpolate in Mercator space to avoid edge drift after zoom/fitBounds.
-            self.min_x = float(np.radians(self.west))
-            self.max_x = float(np.radians(self.east))
+            self.min_x = radians(self.west)
+            self.max_x = radians(self.east)
             self.min_y = _lat_to_mercator_y(self.south)
             self.max_y = _lat_to_mercator_y(self.north)
 
@@ -95,10 +127,10 @@ class CoordinateConverter:
             u = float(x) / float(self.width)
             v = float(y) / float(self.height)
 
-            tlx, tly = self._corner_mercator["top_left"]
-            trx, try_ = self._corner_mercator["top_right"]
-            brx, bry = self._corner_mercator["bottom_right"]
-            blx, bly = self._corner_mercator["bottom_left"]
+            tlx, tly = self._tlx, self._tly
+            trx, try_ = self._trx, self._try
+            brx, bry = self._brx, self._bry
+            blx, bly = self._blx, self._bly
 
             # Bilinear interpolation in Web Mercator space
             mercator_x = (
@@ -117,10 +149,74 @@ class CoordinateConverter:
             mercator_x = self.min_x + x * self.x_per_pixel
             mercator_y = self.max_y - y * self.y_per_pixel  # Y axis is inverted
 
-        lng = float(np.degrees(mercator_x))
+        # Scalar path: plain math functions, no 0-d NumPy dispatch
+        lng = degrees(mercator_x)
         lat = _mercator_y_to_lat(mercator_y)
         return (lng, lat)
 
+    def pixels_to_geo(self, pixels: np.ndarray) -> np.ndarray:
+        """
+        Convert an array of pixel coordinates to geographic coordinates
+
+        Vectorized counterpart of `pixel_to_geo` for whole polygons.
+
+        Args:
+            pixels: Array of shape (N, 2) with (x, y) pixel coordinates
+
+        Returns:
+            Array of shape (N, 2) with (longitude, latitude)
+        """
+        pixels = np.asarray(pixels, dtype=np.float64).reshape(-1, 2)
+        return self.pixel_to_geo_vec(pixels[:, 0], pixels[:, 1])
+
+    def pixel_to_geo_vec(self, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        """
+        Convert pixel coordinate columns to geographic coordinates in one pass
+
+        Args:
+            xs: Array of N pixel x coordinates
+            ys: Array of N pixel y coordinates
+
+        Returns:
+            Array of shape (N, 2) with (longitude, latitude)
+        """
+        x = np.asarray(xs, dtype=np.float64)
+        y = np.asarray(ys, dtype=np.float64)
+
+        if self._mode == "corners":
+            tlx, tly = self._tlx, self._tly
+            trx, try_ = self._trx, self._try
+            brx, bry = self._brx, self._bry
+            blx, bly = self._blx, self._bly
+
+            if NUMBA_AVAILABLE:
+                geo = np.empty((x.shape[0], 2), dtype=np.float64)
+                _bilinear_to_geo(
+                    np.ascontiguousarray(x), np.ascontiguousarray(y),
+                    1.0 / self.width, 1.0 / self.height,
+                    tlx, tly, trx, try_, brx, bry, blx, bly, geo,
+                )
+                return geo
+
+            u = x / float(self.width)
+            v = y / float(self.height)
+
+            w_tl = (1.0 - u) * (1.0 - v)
+            w_tr = u * (1.0 - v)
+            w_br = u * v
+            w_bl = (1.0 - u) * v
+
+            mercator_x = w_tl * tlx + w_tr * trx + w_br * brx + w_bl * blx
+            mercator_y = w_tl * tly + w_tr * try_ + w_br * bry + w_bl * bly
+        else:
+            mercator_x = self.min_x + x * self.x_per_pixel
+            mercator_y = self.max_y - y * self.y_per_pixel  # Y axis is inverted
+
+        geo = np.empty((x.shape[0], 2), dtype=np.float64)
+        geo[:, 0] = np.degrees(mercator_x)
+        geo[:, 1] = np.degrees(2.0 * np.arctan(np.exp(mercator_y)) - np.pi / 2.0)
+        return geo
+
     def geo_to_pixel(self, lng: float, lat: float) -> Tuple[int, int]:
         """
         Convert geographic coordinates to pixel coordinates
@@ -143,7 +239,7 @@ class CoordinateConverter:
             y = int(round((north - lat) / (north - south) * self.height))
             return x, y
 
-        mercator_x = float(np.radians(lng))
+        mercator_x = radians(lng)
         mercator_y = _lat_to_mercator_y(lat)
         x = int(round((mercator_x - self.min_x) / self.x_per_pixel))
         y = int(round((self.max_y - mercator_y) / self.y_per_pixel))
@@ -151,31 +247,32 @@ class CoordinateConverter:
 
     def polygon_to_geojson(
         self,
-        polygon: List[Tuple[int, int]],
+        polygon: np.ndarray,
         properties: Dict = None
     ) -> Dict:
         """
         Convert pixel polygon to GeoJSON feature
 
         Args:
-            polygon: List of (x, y) pixel coordinates
+            polygon: (N, 2) array (or list) of (x, y) pixel coordinates
             properties: Optional properties dict
 
         Returns:
-            GeoJSON Feature dict
+            GeoJSON Feature dict; the ring is kept as an (M, 2) float64 array
+            for orjson (OPT_SERIALIZE_NUMPY) to serialize
         """
-        # Convert pixel coordinates to geographic coordinates
-        geo_coords = [self.pixel_to_geo(x, y) for x, y in polygon]
+        # Convert all vertices to geographic coordinates in one vectorized pass
+        geo = self.pixels_to_geo(polygon)
 
         # Close the polygon if not already closed
-        if geo_coords[0] != geo_coords[-1]:
-            geo_coords.append(geo_coords[0])
+        if len(geo) and not np.array_equal(geo[0], geo[-1]):
+            geo = np.vstack([geo, geo[:1]])
 
         feature = {
             "type": "Feature",
             "geometry": {
                 "type": "Polygon",
-                "coordinates": [geo_coords]
+                "coordinates": [geo]
             },
             "properties": properties or {}
         }
@@ -184,14 +281,14 @@ class CoordinateConverter:
 
     def mask_to_geojson(
         self,
-        polygons: List[List[Tuple[int, int]]],
+        polygons: List[np.ndarray],
         properties: Dict = None
     ) -> Dict:
         """
         Convert multiple polygons to GeoJSON FeatureCollection
 
         Args:
-            polygons: List of polygons (each polygon is a list of (x, y) coordinates)
+            polygons: List of polygons (each an (N, 2) array of (x, y) coordinates)
             properties: Optional properties dict
 
         Returns:
@@ -2,17 +2,66 @@
 # Uses Hugging Face Inference API instead of local SAM3 deployment
 
 import os
+import asyncio
 import base64
-import requests
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
+import hashlib
+import json
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import threading
+import time
+import httpx
+import orjson
 import numpy as np
 from typing import List, Dict, Optional, Tuple
-from PIL import Image
-import io
+from urllib.parse import quote
 import cv2
 import ssl
 
+try:
+    import simplejpeg  # libjpeg-turbo encoder, takes RGB arrays directly
+    SIMPLEJPEG_AVAILABLE = True
+except ImportError:
+    SIMPLEJPEG_AVAILABLE = False
+
+try:
+    import h2  # noqa: F401  -- lets httpx speak HTTP/2
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Transient HTTP statuses retried with exponential backoff (503 = model
+# loading is handled separately)
+RETRY_STATUSES = (429, 500, 502, 504)
+REQUEST_MAX_RETRIES = 3
+RETRY_BACKOFF = 1.0
+
+# Connection pool per client: enough keep-alive connections for the
+# concurrent prompt requests of segment_automatic
+POOL_LIMITS = httpx.Limits(max_connections=8, max_keepalive_connections=8)
+
+# Number of encoded images kept per client (keyed by image content)
+ENCODED_IMAGE_CACHE_SIZE = 4
+
+# Longest side of the image sent to the API; SAM3 runs at a fixed internal
+# resolution, so larger uploads only cost encode time and bandwidth
+UPLOAD_MAX_SIDE = int(os.getenv('SAM3_HF_MAX_SIDE', 1536))
+
+# How often the async client waits for a cold-starting model (HTTP 503)
+MODEL_LOADING_MAX_RETRIES = 3
+
+# Parsed results kept per client, keyed by (image, prompt, threshold)
+RESULT_CACHE_SIZE = 16
+
+
+def _is_ssl_error(exc: BaseException) -> bool:
+    """Whether an httpx connection error was caused by a TLS/SSL failure."""
+    while exc is not None:
+        if isinstance(exc, ssl.SSLError):
+            return True
+        exc = exc.__cause__ or exc.__context__
+    return False
+
 
 class SAM3HFAPISegmenter:
     """
@@ -39,55 +88,231 @@ class SAM3HFAPISegmenter:
         self.headers = {
             "Authorization": f"Bearer {self.hf_token}"
         }
-
-        # Create session with retry strategy
-        self.session = requests.Session()
-        retry_strategy = Retry(
-            total=3,
-            backoff_factor=1,
-            status_forcelist=[429, 500, 502, 503, 504],
-            allowed_methods=["HEAD", "GET", "POST"]
+        # Request bodies are pre-serialized JSON bytes (see _build_payload)
+        self.json_headers = {**self.headers, "Content-Type": "application/json"}
+
+        # Long-lived HTTP client: keeps one TLS connection (HTTP/2 when h2 is
+        # installed, so concurrent prompts multiplex over it) to the HF router
+        # warm across calls. Connection failures are retried by the transport.
+        # Load the CA bundle once and share it between the sync and async
+        # clients instead of building a TLS context per transport
+        self.ssl_context = httpx.create_ssl_context(trust_env=True)
+        self.client = httpx.Client(
+            headers=self.headers,
+            timeout=60.0,
+            verify=self.ssl_context,
+            transport=httpx.HTTPTransport(
+                verify=self.ssl_context,
+                limits=POOL_LIMITS,
+                retries=3,
+                http2=HTTP2_AVAILABLE
+            ),
+            trust_env=True  # HTTP(S)_PROXY from environment
         )
-        adapter = HTTPAdapter(max_retries=retry_strategy)
-        self.session.mount("https://", adapter)
-        self.session.mount("http://", adapter)
 
-        # Configure proxy from environment variables
+        # Proxy from environment variables (picked up by the client via trust_env)
         http_proxy = os.getenv('HTTP_PROXY') or os.getenv('http_proxy')
         https_proxy = os.getenv('HTTPS_PROXY') or os.getenv('https_proxy')
-
-        if http_proxy or https_proxy:
-            proxies = {}
-            if http_proxy:
-                proxies['http'] = http_proxy
-                print(f"使用 HTTP 代理: {http_proxy}")
-            if https_proxy:
-                proxies['https'] = https_proxy
-                print(f"使用 HTTPS 代理: {https_proxy}")
-            self.session.proxies.update(proxies)
+        if http_proxy:
+            print(f"使用 HTTP 代理: {http_proxy}")
+        if https_proxy:
+            print(f"使用 HTTPS 代理: {https_proxy}")
 
         self.current_image = None
-        self.current_image_pil = None
+        self.current_image_bgr = None
+        self._upload_image = None
+        self._image_key = None
+        # Content key -> encoded upload, so repeated prompts on the same image
+        # (e.g. the automatic-mode prompt fallbacks) encode it only once
+        self._encoded_cache: "OrderedDict[tuple, bytes]" = OrderedDict()
+        # (image key, prompt, threshold, upload mode) -> parsed results
+        self._result_cache: "OrderedDict[tuple, List[Dict]]" = OrderedDict()
+        # segment_automatic queries from worker threads
+        self._cache_lock = threading.Lock()
+        # Upload images as JPEG by default (much faster to encode and smaller
+        # to send); set to True to send lossless PNG instead
+        self.lossless_upload = False
+        # Send the encoded image as the raw request body (prompt parameters in
+        # X-* headers) instead of base64 inside JSON: ~25% fewer bytes and no
+        # base64 pass. Only for endpoints that accept raw image bodies.
+        self.raw_upload = os.getenv('SAM3_HF_RAW_UPLOAD', 'false').lower() in ('1', 'true', 'yes')
+
+        # Async client for asegment_from_text, created on first use so it is
+        # bound to the server's event loop
+        self.aclient: Optional[httpx.AsyncClient] = None
 
         print(f"SAM3 HF API client initialized with model: {self.model_id}")
 
-    def set_image(self, image: np.ndarray):
+    def set_image(self, image: np.ndarray, max_side: int = UPLOAD_MAX_SIDE):
         """
         Set the current image for segmentation.
 
         Args:
             image: Image as numpy array (H, W, 3) in RGB format
+            max_side: Downscale the uploaded copy so its longest side is at most
+                this many pixels (returned masks are scaled back up)
         """
+        # One contiguous copy up front (no-op for the usual contiguous input),
+        # shared by the content hash and both encoders
+        image = np.ascontiguousarray(image)
         self.current_image = image
-        self.current_image_pil = Image.fromarray(image)
+        height, width = image.shape[:2]
+        if max_side and max(height, width) > max_side:
+            ratio = max_side / max(height, width)
+            dsize = (max(1, round(width * ratio)), max(1, round(height * ratio)))
+            self._upload_image = cv2.resize(image, dsize, interpolation=cv2.INTER_AREA)
+        else:
+            self._upload_image = image
+        # BGR copy is only built when the image actually has to be encoded
+        self.current_image_bgr = None
+        digest = hashlib.blake2b(image, digest_size=16)
+        digest.update(repr(image.shape).encode())
+        self._image_key = digest.digest()
         print(f"Image set: {image.shape}")
 
-    def _encode_image_to_base64(self, image: Image.Image) -> str:
-        """Convert PIL Image to base64 string."""
-        buffered = io.BytesIO()
-        image.save(buffered, format="PNG")
-        img_str = base64.b64encode(buffered.getvalue()).decode()
-        return img_str
+    def _get_upload_bytes(self, raw: bool = False) -> bytes:
+        """
+        Return the encoded upload of the current image, encoding it on a cache miss.
+
+        Args:
+            raw: Return the encoded image file bytes instead of base64
+
+        Returns:
+            Encoded image bytes, or base64 encoded image (ASCII bytes)
+        """
+        key = (self._image_key, self.lossless_upload, raw)
+        with self._cache_lock:
+            cached = self._encoded_cache.get(key)
+            if cached is not None:
+                self._encoded_cache.move_to_end(key)
+                return cached
+
+        if SIMPLEJPEG_AVAILABLE and not self.lossless_upload:
+            # Fast path: encode the RGB array directly, no BGR copy needed
+            data = simplejpeg.encode_jpeg(
+                self._upload_image, quality=90, colorspace='RGB', fastdct=True
+            )
+            if not raw:
+                data = base64.b64encode(data)
+        else:
+            if self.current_image_bgr is None:
+                # Convert to OpenCV channel order once per image
+                self.current_image_bgr = cv2.cvtColor(self._upload_image, cv2.COLOR_RGB2BGR)
+            if raw:
+                data = self._encode_image(self.current_image_bgr, self.lossless_upload)
+            else:
+                data = self._encode_image_to_base64(self.current_image_bgr, self.lossless_upload)
+
+        with self._cache_lock:
+            self._encoded_cache[key] = data
+            while len(self._encoded_cache) > ENCODED_IMAGE_CACHE_SIZE:
+                self._encoded_cache.popitem(last=False)
+        return data
+
+    def _result_key(self, text_prompt: str, confidence_threshold: float) -> tuple:
+        # raw_upload only changes the transport of the same encoded image, so
+        # it is not part of the key
+        return (self._image_key, text_prompt, confidence_threshold, self.lossless_upload)
+
+    def _get_cached_results(self, key: tuple) -> Optional[List[Dict]]:
+        """Return a copy of memoized results for key, or None on a miss."""
+        with self._cache_lock:
+            cached = self._result_cache.get(key)
+            if cached is None:
+                return None
+            self._result_cache.move_to_end(key)
+        # Shallow copies so callers can annotate results without touching the cache
+        return [dict(r) for r in cached]
+
+    def _store_results(self, key: tuple, results: List[Dict]):
+        with self._cache_lock:
+            self._result_cache[key] = [dict(r) for r in results]
+            while len(self._result_cache) > RESULT_CACHE_SIZE:
+                self._result_cache.popitem(last=False)
+
+    def _encode_image(self, image_bgr: np.ndarray, lossless: bool = False) -> bytes:
+        """
+        Encode a BGR image array to JPEG/PNG file bytes with OpenCV.
+
+        Args:
+            image_bgr: Image as numpy array (H, W, 3) in BGR format
+            lossless: Encode as PNG (fast compress level 1) instead of JPEG quality 90
+
+        Returns:
+            Encoded image bytes
+        """
+        if lossless:
+            ok, encoded = cv2.imencode('.png', image_bgr, [cv2.IMWRITE_PNG_COMPRESSION, 1])
+        else:
+            ok, encoded = cv2.imencode('.jpg', image_bgr, [cv2.IMWRITE_JPEG_QUALITY, 90])
+        if not ok:
+            raise RuntimeError("Failed to encode image for HF API upload")
+        return encoded.tobytes()
+
+    def _encode_image_to_base64(self, image_bgr: np.ndarray, lossless: bool = False) -> bytes:
+        """
+        Encode a BGR image array to base64 with OpenCV.
+
+        Args:
+            image_bgr: Image as numpy array (H, W, 3) in BGR format
+            lossless: Encode as PNG (fast compress level 1) instead of JPEG quality 90
+
+        Returns:
+            Base64 encoded image (ASCII bytes)
+        """
+        return base64.b64encode(self._encode_image(image_bgr, lossless))
+
+    def _build_payload(self, text_prompt: str, confidence_threshold: float) -> Tuple[bytes, Dict]:
+        """
+        Build the HF Inference API request body and headers for a text prompt.
+
+        By default the body is JSON. Only the small parameters object goes
+        through json.dumps; the base64 image (ASCII, needs no JSON escaping)
+        is spliced in as bytes, so the multi-MB string is never copied into a
+        str or walked by the encoder. With raw_upload the body is the encoded
+        image itself and the parameters travel in headers.
+
+        Returns:
+            Tuple of (request body bytes, request headers)
+        """
+        mime_type = "image/png" if self.lossless_upload else "image/jpeg"
+
+        if self.raw_upload:
+            headers = {
+                **self.headers,
+                "Content-Type": mime_type,
+                "X-Prompt": quote(text_prompt),  # headers must be ASCII
+                "X-Prompt-Type": "text",
+                "X-Threshold": str(confidence_threshold),
+            }
+            return self._get_upload_bytes(raw=True), headers
+
+        # Prepare payload for HF Inference API
+        # Format based on SAM3 API structure
+        parameters = {
+            "prompt": text_prompt,
+            "prompt_type": "text",
+            "threshold": confidence_threshold
+        }
+        return self._build_json_body(parameters), self.json_headers
+
+    def _build_json_body(self, parameters: Dict) -> bytes:
+        """
+        Build a JSON request body with the current image as a base64 data URI.
+
+        Args:
+            parameters: Request parameters object
+
+        Returns:
+            Request body bytes
+        """
+        mime_type = "image/png" if self.lossless_upload else "image/jpeg"
+        # Convert image to base64 (cached per image content)
+        img_base64 = self._get_upload_bytes()
+        return b"".join((
+            b'{"inputs":"data:', mime_type.encode(), b';base64,', img_base64,
+            b'","parameters":', json.dumps(parameters).encode(), b'}'
+        ))
 
     def segment_from_text(
         self,
@@ -104,33 +329,21 @@ class SAM3HFAPISegmenter:
         Returns:
             List of segmentation results with masks and metadata
         """
-        if self.current_image_pil is None:
+        if self.current_image is None:
             raise ValueError("No image set. Call set_image() first.")
 
+        cache_key = self._result_key(text_prompt, confidence_threshold)
+        cached = self._get_cached_results(cache_key)
+        if cached is not None:
+            print(f"Using cached HF API results for '{text_prompt}'")
+            return cached
+
         print(f"Sending text segmentation request to HF API: '{text_prompt}'...")
 
-        # Convert image to base64
-        img_base64 = self._encode_image_to_base64(self.current_image_pil)
-
-        # Prepare payload for HF Inference API
-        # Format based on SAM3 API structure
-        payload = {
-            "inputs": f"data:image/png;base64,{img_base64}",
-            "parameters": {
-                "prompt": text_prompt,
-                "prompt_type": "text",
-                "threshold": confidence_threshold
-            }
-        }
+        payload, headers = self._build_payload(text_prompt, confidence_threshold)
 
         try:
-            response = self.session.post(
-                self.api_url,
-                headers=self.headers,
-                json=payload,
-                timeout=60,
-                verify=True  # Ensure SSL verification
-            )
+            response = self._post_with_retries(payload, headers)
 
             if response.status_code == 503:
                 # Model is loading
@@ -139,40 +352,162 @@ class SAM3HFAPISegmenter:
             response.raise_for_status()
 
             # Parse response
-            result = response.json()
+            result = orjson.loads(response.content)
             print(f"API response received: {type(result)}")
 
             # Convert API response to our internal format
-            return self._parse_api_response(result, text_prompt)
-
-        except requests.exceptions.SSLError as e:
-            error_msg = f"SSL connection error: {str(e)}"
-            print(error_msg)
-            print("\n⚠️  解决方案:")
-            print("1. 检查网络连接和防火墙设置")
-            print("2. 尝试使用代理或 VPN")
-            print("3. 或者先使用'点击分割'模式（使用本地 SAM 1.0）")
-            raise RuntimeError(f"无法连接到 Hugging Face API: SSL错误。请检查网络设置或使用点击分割模式。")
-        except requests.exceptions.ConnectionError as e:
+            results = self._parse_api_response(result, text_prompt)
+            self._store_results(cache_key, results)
+            return results
+
+        except httpx.ConnectError as e:
+            if _is_ssl_error(e):
+                error_msg = f"SSL connection error: {str(e)}"
+                print(error_msg)
+                print("\n⚠️  解决方案:")
+                print("1. 检查网络连接和防火墙设置")
+                print("2. 尝试使用代理或 VPN")
+                print("3. 或者先使用'点击分割'模式（使用本地 SAM 1.0）")
+                raise RuntimeError(f"无法连接到 Hugging Face API: SSL错误。请检查网络设置或使用点击分割模式。")
             error_msg = f"Connection error: {str(e)}"
             print(error_msg)
             raise RuntimeError(f"无法连接到 Hugging Face API: 网络错误。请检查网络连接。")
-        except requests.exceptions.Timeout as e:
+        except httpx.TimeoutException as e:
             error_msg = f"Request timeout: {str(e)}"
             print(error_msg)
             raise RuntimeError(f"Hugging Face API 请求超时。请稍后重试或使用点击分割模式。")
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPStatusError as e:
             print(f"API request failed: {e}")
-            if hasattr(e, 'response') and e.response is not None:
-                print(f"Response status: {e.response.status_code}")
-                print(f"Response body: {e.response.text[:500]}")
+            print(f"Response status: {e.response.status_code}")
+            print(f"Response body: {e.response.text[:500]}")
+            raise
+        except httpx.RequestError as e:
+            print(f"API request failed: {e}")
+            raise
+
+    def _post_with_retries(self, body: bytes, headers: Dict) -> httpx.Response:
+        """POST to the API, retrying transient statuses with exponential backoff."""
+        for attempt in range(REQUEST_MAX_RETRIES + 1):
+            response = self.client.post(self.api_url, content=body, headers=headers)
+            if response.status_code not in RETRY_STATUSES or attempt == REQUEST_MAX_RETRIES:
+                return response
+            time.sleep(RETRY_BACKOFF * 2 ** attempt)
+        return response
+
+    def _get_async_client(self) -> httpx.AsyncClient:
+        """Return the shared async HTTP client, creating it on first use."""
+        if self.aclient is None or self.aclient.is_closed:
+            self.aclient = httpx.AsyncClient(
+                headers=self.headers,
+                timeout=60.0,
+                verify=self.ssl_context,
+                transport=httpx.AsyncHTTPTransport(
+                    verify=self.ssl_context,
+                    limits=POOL_LIMITS,
+                    retries=3,
+                    http2=HTTP2_AVAILABLE
+                ),
+                trust_env=True  # HTTP(S)_PROXY from environment
+            )
+        return self.aclient
+
+    async def _apost_with_retries(self, body: bytes, headers: Dict) -> httpx.Response:
+        """Async _post_with_retries: same statuses and backoff, waiting with asyncio.sleep."""
+        client = self._get_async_client()
+        for attempt in range(REQUEST_MAX_RETRIES + 1):
+            response = await client.post(self.api_url, content=body, headers=headers)
+            if response.status_code not in RETRY_STATUSES or attempt == REQUEST_MAX_RETRIES:
+                return response
+            await asyncio.sleep(RETRY_BACKOFF * 2 ** attempt)
+        return response
+
+    async def aclose(self):
+        """Close the async HTTP client (called from the app shutdown hook)."""
+        if self.aclient is not None:
+            await self.aclient.aclose()
+            self.aclient = None
+
+    async def asegment_from_text(
+        self,
+        text_prompt: str,
+        confidence_threshold: float = 0.3
+    ) -> List[Dict]:
+        """
+        Async version of segment_from_text.
+
+        Transient statuses get the same backoff as the sync path; a cold-starting
+        model is waited for with asyncio.sleep instead of blocking a thread,
+        retrying at most MODEL_LOADING_MAX_RETRIES times.
+
+        Args:
+            text_prompt: Text description of objects to segment (e.g., "buildings", "trees")
+            confidence_threshold: Minimum confidence for accepting a mask
+
+        Returns:
+            List of segmentation results with masks and metadata
+        """
+        if self.current_image is None:
+            raise ValueError("No image set. Call set_image() first.")
+
+        cache_key = self._result_key(text_prompt, confidence_threshold)
+        cached = self._get_cached_results(cache_key)
+        if cached is not None:
+            print(f"Using cached HF API results for '{text_prompt}'")
+            return cached
+
+        print(f"Sending text segmentation request to HF API: '{text_prompt}'...")
+
+        # Image encoding is CPU bound; keep it off the event loop
+        payload, headers = await asyncio.to_thread(
+            self._build_payload, text_prompt, confidence_threshold
+        )
+        for attempt in range(MODEL_LOADING_MAX_RETRIES + 1):
+            try:
+                response = await self._apost_with_retries(payload, headers)
+            except httpx.TimeoutException as e:
+                print(f"Request timeout: {str(e)}")
+                raise RuntimeError(f"Hugging Face API 请求超时。请稍后重试或使用点击分割模式。")
+            except httpx.RequestError as e:
+                print(f"Connection error: {str(e)}")
+                raise RuntimeError(f"无法连接到 Hugging Face API: 网络错误。请检查网络连接。")
+
+            if response.status_code != 503:
+                break
+
+            # Model is loading
+            if attempt == MODEL_LOADING_MAX_RETRIES:
+                raise RuntimeError(f"Model is loading. Please try again in a few moments.")
+            wait = self._model_loading_wait(response)
+            print(f"Model is loading on HF servers. Waiting {wait}s and retrying...")
+            await asyncio.sleep(wait)
+
+        try:
+            response.raise_for_status()
+        except httpx.HTTPStatusError:
+            print(f"Response status: {response.status_code}")
+            print(f"Response body: {response.text[:500]}")
             raise
 
+        # Parse response
+        result = orjson.loads(response.content)
+        print(f"API response received: {type(result)}")
+
+        # Convert API response to our internal format
+        results = await asyncio.to_thread(self._parse_api_response, result, text_prompt)
+        self._store_results(cache_key, results)
+        return results
+
+    @staticmethod
+    def _model_loading_wait(response) -> float:
+        """Seconds to wait before retrying a 503 (model loading) response."""
+        try:
+            estimated_time = float(response.json().get('estimated_time', 20))
+        except Exception:
+            estimated_time = 20
+        return min(estimated_time + 5, 30)
+
     def _handle_model_loading(self, response, text_prompt: str, confidence_threshold: float) -> List[Dict]:
         """Handle the case when model is loading on HF servers."""
-        import time
-        import json
-
         try:
             error_data = response.json()
             estimated_time = error_data.get('estimated_time', 20)
@@ -210,6 +545,10 @@ class SAM3HFAPISegmenter:
             # Return empty for now, can be extended based on actual API response
             return []
 
+        if not masks_data:
+            print("Parsed 0 masks from API response")
+            return results
+
         for i, mask_data in enumerate(masks_data):
             # Extract mask and score
             if isinstance(mask_data, dict):
@@ -221,7 +560,7 @@ class SAM3HFAPISegmenter:
 
             if mask is not None:
                 results.append({
-                    'mask': np.array(mask),
+                    'mask': self._restore_mask_size(self._decode_mask(mask)),
                     'score': score,
                     'class': class_label,
                     'id': i
@@ -230,6 +569,42 @@ class SAM3HFAPISegmenter:
         print(f"Parsed {len(results)} masks from API response")
         return results
 
+    @staticmethod
+    def _decode_mask(mask) -> np.ndarray:
+        """
+        Convert an API mask (base64 PNG string or nested lists) to a boolean array.
+
+        Args:
+            mask: Base64 encoded image (optionally a data URI) or array-like
+
+        Returns:
+            Boolean mask array
+        """
+        if isinstance(mask, str):
+            # 单次 C 层解码，避免逐元素遍历 Python 列表
+            if mask.startswith('data:'):
+                mask = mask.split(',', 1)[1]
+            buf = np.frombuffer(base64.b64decode(mask), dtype=np.uint8)
+            decoded = cv2.imdecode(buf, cv2.IMREAD_GRAYSCALE)
+            if decoded is None:
+                raise ValueError("Failed to decode base64 mask from API response")
+            return decoded > 0
+        return np.asarray(mask, dtype=bool)
+
+    def _restore_mask_size(self, mask: np.ndarray) -> np.ndarray:
+        """Scale a mask of the downscaled upload back to the original image size."""
+        height, width = self.current_image.shape[:2]
+        if mask.ndim != 2 or mask.shape == (height, width):
+            return mask
+
+        if mask.dtype == np.bool_:
+            resized = cv2.resize(mask.view(np.uint8), (width, height), interpolation=cv2.INTER_NEAREST)
+            return resized.view(np.bool_)
+        if mask.dtype not in (np.uint8, np.float32):
+            # cv2.resize does not take int64/float64 masks; 0/1 and 0/255 both fit uint8
+            mask = mask.astype(np.float32 if mask.dtype.kind == 'f' else np.uint8)
+        return cv2.resize(mask, (width, height), interpolation=cv2.INTER_NEAREST)
+
     def segment_automatic(self) -> List[Dict]:
         """
         Automatically segment all objects in image via HF API.
@@ -240,7 +615,7 @@ class SAM3HFAPISegmenter:
         Returns:
             List of segmentation results
         """
-        if self.current_image_pil is None:
+        if self.current_image is None:
             raise ValueError("No image set. Call set_image() first.")
 
         print("Attempting automatic segmentation via HF API...")
@@ -249,14 +624,28 @@ class SAM3HFAPISegmenter:
         # This may not work perfectly - HF API is optimized for specific prompts
         generic_prompts = ["all objects", "everything", "objects"]
 
-        for prompt in generic_prompts:
-            try:
-                results = self.segment_from_text(prompt, confidence_threshold=0.3)
+        # Encode once up front so the concurrent requests share the cached upload
+        self._get_upload_bytes(raw=self.raw_upload)
+
+        # The requests are I/O bound: send all prompts at once and take the
+        # first non-empty answer instead of waiting for each one in turn
+        executor = ThreadPoolExecutor(max_workers=len(generic_prompts))
+        try:
+            futures = {
+                executor.submit(self.segment_from_text, prompt, confidence_threshold=0.3): prompt
+                for prompt in generic_prompts
+            }
+            for future in as_completed(futures):
+                try:
+                    results = future.result()
+                except Exception as e:
+                    print(f"Failed with prompt '{futures[future]}': {e}")
+                    continue
                 if results:
                     return results
-            except Exception as e:
-                print(f"Failed with prompt '{prompt}': {e}")
-                continue
+        finally:
+            # Don't wait for the slower requests once we have an answer
+            executor.shutdown(wait=False, cancel_futures=True)
 
         # If all fail, return empty
         print("Automatic segmentation not available via HF API. Try text prompts instead.")
@@ -266,7 +655,7 @@ class SAM3HFAPISegmenter:
         self,
         mask: np.ndarray,
         simplify_tolerance: float = 1.0
-    ) -> List[List[Tuple[int, int]]]:
+    ) -> List[np.ndarray]:
         """
         Convert binary mask to polygon contours.
 
@@ -275,10 +664,17 @@ class SAM3HFAPISegmenter:
             simplify_tolerance: Tolerance for polygon simplification
 
         Returns:
-            List of polygon contours
+            List of polygon contours, each an (N, 2) int32 vertex array
         """
-        # Convert mask to uint8
-        mask_uint8 = (mask * 255).astype(np.uint8)
+        # Convert mask to uint8 (bool masks are viewed in place and uint8
+        # masks used as is, no copy; findContours treats any non-zero pixel
+        # as foreground)
+        if mask.dtype == np.bool_:
+            mask_uint8 = mask.view(np.uint8)
+        elif mask.dtype == np.uint8:
+            mask_uint8 = mask
+        else:
+            mask_uint8 = (mask * 255).astype(np.uint8)
 
         # Find contours
         contours, _ = cv2.findContours(
@@ -292,14 +688,13 @@ class SAM3HFAPISegmenter:
         for contour in contours:
             if len(contour) >= 3:  # Valid polygon needs at least 3 points
                 # Simplify polygon to reduce point count
-                epsilon = simplify_tolerance
-                approx = cv2.approxPolyDP(contour, epsilon, True)
+                approx = cv2.approxPolyDP(contour, simplify_tolerance, True)
 
-                polygon = approx.squeeze().tolist()
-                if isinstance(polygon[0], list):
+                # Keep vertices as an (N, 2) array; list conversion is left
+                # to the JSON serializer (orjson handles NumPy arrays)
+                polygon = approx.reshape(-1, 2)
+                if len(polygon) >= 3:  # Ensure it's still a valid polygon
                     polygons.append(polygon)
-                elif len(polygon) >= 3:
-                    polygons.append([polygon])
 
         return polygons
 
@@ -315,20 +710,30 @@ class SAM3HFAPISegmenter:
 
 
 # Singleton instance
-_sam3_hf_instance = None
+# One client per token (keyed by a digest, not the token itself); the lock
+# makes concurrent first-init create a single instance
+_sam3_hf_instances: Dict[bytes, SAM3HFAPISegmenter] = {}
+_sam3_hf_lock = threading.Lock()
 
 
 def get_sam3_hf_instance(hf_token: str = None) -> SAM3HFAPISegmenter:
     """
-    Get or create SAM3 HF API instance (singleton pattern).
+    Get or create SAM3 HF API instance (one per token, thread-safe).
 
     Args:
-        hf_token: Hugging Face API token
+        hf_token: Hugging Face API token (defaults to HUGGINGFACE_TOKEN / HF_TOKEN)
 
     Returns:
         SAM3HFAPISegmenter instance
     """
-    global _sam3_hf_instance
-    if _sam3_hf_instance is None:
-        _sam3_hf_instance = SAM3HFAPISegmenter(hf_token)
-    return _sam3_hf_instance
+    token = hf_token or os.getenv('HUGGINGFACE_TOKEN') or os.getenv('HF_TOKEN') or ''
+    key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+    instance = _sam3_hf_instances.get(key)
+    if instance is None:
+        with _sam3_hf_lock:
+            instance = _sam3_hf_instances.get(key)
+            if instance is None:
+                instance = SAM3HFAPISegmenter(hf_token)
+                _sam3_hf_instances[key] = instance
+    return instance
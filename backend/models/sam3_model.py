@@ -3,30 +3,32 @@
 import torch
 import numpy as np
 from typing import List, Tuple, Dict, Optional
+import hashlib
+import importlib.util
 import os
 import tempfile
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 import cv2
-from PIL import Image
+
+from models.contours import approx_contours
 
 # Ensure Hugging Face token is set for model downloads
 # Check HUGGINGFACE_TOKEN first, then fall back to HF_TOKEN
 if os.getenv('HUGGINGFACE_TOKEN') and not os.getenv('HF_TOKEN'):
     os.environ['HF_TOKEN'] = os.getenv('HUGGINGFACE_TOKEN')
 
-# Try importing samgeo - gracefully handle if not installed
-try:
-    from samgeo import SamGeo, SamGeo2, SamGeo3
-    SAMGEO_AVAILABLE = True
-except ImportError:
-    try:
-        from samgeo import SamGeo, SamGeo2
-        SAMGEO_AVAILABLE = True
-        SamGeo3 = None  # Mark as not available
-    except ImportError:
-        print("Warning: samgeo not installed. SAM3 features will not be available.")
-        print("Install with: pip install segment-geospatial[samgeo3]")
-        SAMGEO_AVAILABLE = False
-        SamGeo3 = None
+# Only check that samgeo is installed; importing it pulls in torch,
+# segment-anything and GDAL, so the import itself is deferred until a
+# SAM3Segmenter is actually created (see _load_samgeo)
+SAMGEO_AVAILABLE = importlib.util.find_spec("samgeo") is not None
+if not SAMGEO_AVAILABLE:
+    print("Warning: samgeo not installed. SAM3 features will not be available.")
+    print("Install with: pip install segment-geospatial[samgeo3]")
+
+# Compute the point-prompt image embedding in a background thread as soon as
+# an image is set, hiding the encoder latency before the first click
+PRECOMPUTE_EMBEDDING = os.getenv('SAM3_PRECOMPUTE_EMBEDDING', 'false').lower() in ('1', 'true', 'yes')
 
 
 class SAM3Segmenter:
@@ -35,6 +37,29 @@ class SAM3Segmenter:
     Provides unified interface for text prompts, automatic segmentation, and point prompts.
     """
 
+    # (SamGeo2, SamGeo3) once samgeo has been imported; SamGeo3 may be None
+    _samgeo = None
+
+    @classmethod
+    def _load_samgeo(cls):
+        """Import samgeo on first use and cache its model classes on the class."""
+        if cls._samgeo is None:
+            global SAMGEO_AVAILABLE
+            try:
+                from samgeo import SamGeo2
+            except ImportError:
+                SAMGEO_AVAILABLE = False
+                raise ImportError(
+                    "segment-geospatial package not installed. "
+                    "Install with: pip install segment-geospatial[samgeo3]"
+                )
+            try:
+                from samgeo import SamGeo3
+            except ImportError:
+                SamGeo3 = None  # Mark as not available
+            cls._samgeo = (SamGeo2, SamGeo3)
+        return cls._samgeo
+
     def __init__(self, model_type: str = "vit_h", checkpoint_path: str = None, use_sam3: bool = True):
         """
         Initialize SAM3 segmenter using samgeo package.
@@ -44,18 +69,26 @@ class SAM3Segmenter:
             checkpoint_path: Optional path to model checkpoint (samgeo auto-downloads if None)
             use_sam3: If True, use SAM3; if False, fallback to SAM 1.0
         """
-        if not SAMGEO_AVAILABLE:
-            raise ImportError(
-                "segment-geospatial package not installed. "
-                "Install with: pip install segment-geospatial[samgeo3]"
-            )
+        SamGeo2, SamGeo3 = self._load_samgeo()
 
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
         self.model_type = model_type
         self.use_sam3 = use_sam3
         self.current_image = None
         self.current_image_path = None
+        # Content digest of current_image
+        self._image_key = None
+        # (digest, path) of the last image written to disk
+        self._last_image_key = None
+        # Digest of the image whose embedding samgeo's predictor holds
+        self._embedded_image_key = None
+        # Single worker for background embedding (created on first use)
+        self._embed_pool: Optional[ThreadPoolExecutor] = None
+        self._embed_future: Optional[Future] = None
+        self._embed_future_key = None
         self.temp_dir = tempfile.mkdtemp(prefix="guzhu_sam3_")
+        # Fixed temporary path reused by every set_image call
+        self.default_image_path = os.path.join(self.temp_dir, "current_image.png")
 
         print(f"Initializing SAM{'3' if use_sam3 else ''} model ({model_type}) on {self.device}...")
 
@@ -94,14 +127,67 @@ class SAM3Segmenter:
 
         # samgeo requires file path, so save image temporarily
         if temp_filename is None:
-            temp_filename = os.path.join(self.temp_dir, "current_image.png")
+            temp_filename = self.default_image_path
+
+        # Skip the PNG write when the same pixels are already on disk at that path
+        digest = hashlib.blake2b(np.ascontiguousarray(image), digest_size=16)
+        digest.update(repr(image.shape).encode())
+        self._image_key = digest.digest()
+        if PRECOMPUTE_EMBEDDING:
+            self._schedule_embedding()
+        image_key = (self._image_key, temp_filename)
+        if image_key == self._last_image_key and os.path.exists(temp_filename):
+            print(f"Image unchanged, reusing temporary path: {temp_filename}")
+            return
 
         self.current_image_path = temp_filename
 
-        # Save image
-        Image.fromarray(image).save(temp_filename)
+        # Save image (OpenCV PNG at compression level 1: lossless and much
+        # faster than PIL's default level)
+        ok = cv2.imwrite(
+            temp_filename,
+            cv2.cvtColor(image, cv2.COLOR_RGB2BGR),
+            [cv2.IMWRITE_PNG_COMPRESSION, 1]
+        )
+        if not ok:
+            raise RuntimeError(f"Failed to write image to {temp_filename}")
+        self._last_image_key = image_key
         print(f"Image saved to temporary path: {temp_filename}")
 
+    def _compute_embedding(self, image: np.ndarray, image_key: bytes):
+        """Run samgeo's image encoder for image and record whose embedding it holds."""
+        self.sam.set_image(image)
+        self._embedded_image_key = image_key
+
+    def _schedule_embedding(self):
+        """Start computing the current image's embedding in the background."""
+        if not hasattr(self.sam, 'set_image'):
+            return
+        if self._image_key in (self._embedded_image_key, self._embed_future_key):
+            return
+        if self._embed_pool is None:
+            self._embed_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sam3-embed")
+        # Single worker: runs after any embedding still in flight
+        self._embed_future = self._embed_pool.submit(
+            self._compute_embedding, self.current_image, self._image_key
+        )
+        self._embed_future_key = self._image_key
+
+    def _wait_for_embedding(self):
+        """Block until a pending background embedding has finished."""
+        future = self._embed_future
+        if future is None:
+            return
+        try:
+            future.result()
+        except Exception as e:
+            # segment_from_points recomputes inline if the key still differs
+            print(f"Background embedding failed: {e}")
+        finally:
+            if self._embed_future is future:
+                self._embed_future = None
+                self._embed_future_key = None
+
     def segment_from_text(
         self,
         text_prompt: str,
@@ -120,6 +206,12 @@ class SAM3Segmenter:
         if self.current_image_path is None:
             raise ValueError("No image set. Call set_image() first.")
 
+        # Don't run the model concurrently with a background embedding;
+        # generate() replaces the predictor's image state, so the point
+        # embedding is recomputed on the next click
+        self._wait_for_embedding()
+        self._embedded_image_key = None
+
         if not self.use_sam3:
             raise NotImplementedError(
                 "Text prompts require SAM3. Current model does not support this feature."
@@ -168,6 +260,12 @@ class SAM3Segmenter:
         if self.current_image_path is None:
             raise ValueError("No image set. Call set_image() first.")
 
+        # Don't run the model concurrently with a background embedding;
+        # generate() replaces the predictor's image state, so the point
+        # embedding is recomputed on the next click
+        self._wait_for_embedding()
+        self._embedded_image_key = None
+
         print("Performing automatic segmentation...")
 
         # Create output directory
@@ -219,6 +317,14 @@ class SAM3Segmenter:
 
         # Use samgeo's predict method (similar to SAM 1.0)
         try:
+            # Compute the image embedding from the in-memory array once per
+            # image (or pick up the one precomputed in set_image); later
+            # clicks on the same image only run the mask decoder
+            self._wait_for_embedding()
+            if hasattr(self.sam, 'set_image') and self._embedded_image_key != self._image_key:
+                self.sam.set_image(self.current_image)
+                self._embedded_image_key = self._image_key
+
             masks, scores, logits = self.sam.predict(
                 point_coords=point_coords,
                 point_labels=point_labels,
@@ -242,7 +348,7 @@ class SAM3Segmenter:
         self,
         mask: np.ndarray,
         simplify_tolerance: float = 1.0
-    ) -> List[List[Tuple[int, int]]]:
+    ) -> List[np.ndarray]:
         """
         Convert binary mask to polygon contours.
         Reuses logic from original sam_model.py for consistency.
@@ -252,10 +358,17 @@ class SAM3Segmenter:
             simplify_tolerance: Tolerance for polygon simplification (higher = simpler)
 
         Returns:
-            List of polygon contours
+            List of polygon contours, each an (N, 2) int32 vertex array
         """
-        # Convert mask to uint8
-        mask_uint8 = (mask * 255).astype(np.uint8)
+        # Convert mask to uint8 (bool masks are viewed in place and uint8
+        # masks used as is, no copy; findContours treats any non-zero pixel
+        # as foreground)
+        if mask.dtype == np.bool_:
+            mask_uint8 = mask.view(np.uint8)
+        elif mask.dtype == np.uint8:
+            mask_uint8 = mask
+        else:
+            mask_uint8 = (mask * 255).astype(np.uint8)
 
         # Find contours
         contours, _ = cv2.findContours(
@@ -264,19 +377,15 @@ class SAM3Segmenter:
             cv2.CHAIN_APPROX_SIMPLE
         )
 
-        # Convert contours to list of points
+        # Simplify polygons to reduce point count and convert them to
+        # vertex arrays
         polygons = []
-        for contour in contours:
-            if len(contour) >= 3:  # Valid polygon needs at least 3 points
-                # Simplify polygon to reduce point count
-                epsilon = simplify_tolerance
-                approx = cv2.approxPolyDP(contour, epsilon, True)
-
-                polygon = approx.squeeze().tolist()
-                if isinstance(polygon[0], list):
-                    polygons.append(polygon)
-                elif len(polygon) >= 3:  # Ensure it's still a valid polygon
-                    polygons.append([polygon])
+        for approx in approx_contours(contours, simplify_tolerance):
+            # Keep vertices as an (N, 2) array; list conversion is left
+            # to the JSON serializer (orjson handles NumPy arrays)
+            polygon = approx.reshape(-1, 2)
+            if len(polygon) >= 3:  # Ensure it's still a valid polygon
+                polygons.append(polygon)
 
         return polygons
 
@@ -325,6 +434,9 @@ class SAM3Segmenter:
     def cleanup(self):
         """Clean up temporary files."""
         import shutil
+        if getattr(self, '_embed_pool', None) is not None:
+            self._embed_pool.shutdown(wait=False, cancel_futures=True)
+            self._embed_pool = None
         if os.path.exists(self.temp_dir):
             shutil.rmtree(self.temp_dir)
             print(f"Cleaned up temporary directory: {self.temp_dir}")
@@ -335,7 +447,10 @@ class SAM3Segmenter:
 
 
 # Singleton instance for SAM3
-_sam3_instance = None
+# One segmenter per configuration; the lock makes concurrent first-init
+# load the (slow, ~several seconds) model only once
+_sam3_instances: Dict[tuple, "SAM3Segmenter"] = {}
+_sam3_lock = threading.Lock()
 
 
 def get_sam3_instance(
@@ -344,7 +459,10 @@ def get_sam3_instance(
     use_sam3: bool = True
 ) -> SAM3Segmenter:
     """
-    Get or create SAM3 instance (singleton pattern).
+    Get or create SAM3 instance (one per configuration, thread-safe).
+
+    Construction loads model weights and blocks; call it via
+    asyncio.to_thread from async code.
 
     Args:
         model_type: Model type (vit_h, vit_l, vit_b)
@@ -354,7 +472,12 @@ def get_sam3_instance(
     Returns:
         SAM3Segmenter instance
     """
-    global _sam3_instance
-    if _sam3_instance is None:
-        _sam3_instance = SAM3Segmenter(model_type, checkpoint_path, use_sam3)
-    return _sam3_instance
+    key = (model_type, checkpoint_path, use_sam3)
+    instance = _sam3_instances.get(key)
+    if instance is None:
+        with _sam3_lock:
+            instance = _sam3_instances.get(key)
+            if instance is None:
+                instance = SAM3Segmenter(model_type, checkpoint_path, use_sam3)
+                _sam3_instances[key] = instance
+    return instance
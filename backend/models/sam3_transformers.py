@@ -2,11 +2,16 @@
 # Based on official Hugging Face documentation
 
 import torch
+import torch.nn.functional as F
 import numpy as np
 from typing import List, Dict, Optional, Tuple
-from PIL import Image
 import cv2
 import os
+import threading
+from collections import OrderedDict
+from contextlib import nullcontext
+
+from models.sam_model import default_device
 
 # Try importing transformers SAM3
 try:
@@ -16,6 +21,60 @@ except ImportError:
     TRANSFORMERS_SAM3_AVAILABLE = False
     print("Warning: transformers SAM3 not available. Install with: pip install transformers")
 
+# torchvision's NMS kernel for cross-prompt deduplication in segment_automatic
+try:
+    from torchvision.ops import nms
+    TORCHVISION_AVAILABLE = True
+except ImportError:
+    TORCHVISION_AVAILABLE = False
+
+# Boxes overlapping more than this are treated as the same object
+AUTOMATIC_NMS_IOU = 0.5
+
+# Tokenized prompt batches kept on the device (prompts repeat across images)
+TEXT_INPUT_CACHE_SIZE = 32
+
+# Compile the model with TorchInductor (GPU only): the vision encoder (fixed
+# input size) with CUDA Graphs, the text/DETR decoder with dynamic shapes since
+# the prompt batch size varies. Compiling takes about a minute at load time.
+SAM3_COMPILE = os.getenv('SAM3_COMPILE', '0').lower() in ('1', 'true', 'yes')
+
+# Resize/normalize the image on the GPU instead of in the (CPU) processor
+SAM3_GPU_PREPROCESS = os.getenv('SAM3_GPU_PREPROCESS', '1').lower() in ('1', 'true', 'yes')
+
+
+def _expand_batch(value, batch_size: int):
+    """
+    Broadcast batch-size-1 model features to batch_size without copying.
+
+    Handles tensors and (nested) tuples/lists/ModelOutput dicts of tensors.
+    """
+    if torch.is_tensor(value):
+        return value.expand(batch_size, *value.shape[1:])
+    if isinstance(value, (tuple, list)):
+        return type(value)(_expand_batch(v, batch_size) for v in value)
+    if isinstance(value, dict):  # transformers ModelOutput
+        return type(value)(**{k: _expand_batch(v, batch_size) for k, v in value.items()})
+    return value
+
+
+def _to_numpy_batch(values) -> np.ndarray:
+    """Move a tensor, or a list of same-shaped tensors, to NumPy in one transfer."""
+    if torch.is_tensor(values):
+        return values.cpu().numpy()
+    if len(values) > 0 and torch.is_tensor(values[0]):
+        return torch.stack(list(values)).cpu().numpy()
+    return np.asarray(values)
+
+
+def _binary_masks_to_numpy(masks, mask_threshold: float) -> np.ndarray:
+    """Threshold masks on the device and transfer them as uint8 {0, 1}."""
+    if not torch.is_tensor(masks):
+        masks = torch.stack(list(masks))
+    if masks.dtype != torch.bool:
+        masks = masks > mask_threshold
+    return masks.to(torch.uint8).cpu().numpy()
+
 
 class SAM3TransformersSegmenter:
     """
@@ -23,32 +82,163 @@ class SAM3TransformersSegmenter:
     Supports text prompts for Promptable Concept Segmentation (PCS).
     """
 
-    def __init__(self, model_name: str = "facebook/sam3"):
+    def __init__(self, model_name: str = "facebook/sam3", device: Optional[str] = None):
         """
         Initialize SAM3 using Transformers.
 
         Args:
             model_name: Hugging Face model name
+            device: Torch device ("cuda", "mps", "cpu"); defaults to the best
+                available backend
         """
         if not TRANSFORMERS_SAM3_AVAILABLE:
             raise ImportError(
                 "transformers library required. Install with: pip install transformers torch"
             )
 
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.device = default_device(device)
         print(f"Initializing SAM3 Transformers model on {self.device}...")
 
         # Load model and processor
         try:
             self.model = Sam3Model.from_pretrained(model_name).to(self.device)
+            self.model.eval()
             self.processor = Sam3Processor.from_pretrained(model_name)
             print(f"✓ SAM3 model loaded successfully from {model_name}")
         except Exception as e:
             print(f"✗ Failed to load SAM3 model: {e}")
             raise
 
+        # Entry points for the two stages; replaced by compiled versions below
+        self._encode_image = self.model.get_vision_features
+        self._decode = self.model
+        self.compiled = False
+        if SAM3_COMPILE and self.device == "cuda":
+            self._compile()
+
         self.current_image = None
-        self.current_image_pil = None
+        # Vision tower output for the current image, shared by all text prompts
+        self.vision_embeds = None
+        self.original_sizes = None
+        # Image on the device (preprocessed pixel values, or the raw uint8
+        # image when preprocessing runs on the GPU), uploaded on a side
+        # stream so the host->device copy overlaps with earlier GPU work
+        self._pixel_values = None
+        self._copy_stream = torch.cuda.Stream() if self.device == "cuda" else None
+        # Pinned host staging buffer, reused while the input size stays the same
+        self._pinned_staging = None
+        self.device_preprocess = self._init_device_preprocess()
+        # tuple(prompts) -> tokenized text inputs on the device
+        self._text_inputs_cache: "OrderedDict[tuple, object]" = OrderedDict()
+
+    def _autocast(self):
+        """FP16 autocast on CUDA (Tensor Core matmuls); a no-op context on MPS/CPU."""
+        if self.device != "cuda":
+            return nullcontext()
+        return torch.autocast(device_type="cuda", dtype=torch.float16)
+
+    def _init_device_preprocess(self) -> bool:
+        """
+        Read the resize/normalize parameters of the image processor for GPU preprocessing.
+
+        Returns:
+            True if the processor only does a fixed-size resize, rescale and
+            normalize (which _preprocess_on_device reproduces), else False
+        """
+        if not (SAM3_GPU_PREPROCESS and self.device == "cuda"):
+            return False
+        image_processor = getattr(self.processor, "image_processor", None)
+        size = getattr(image_processor, "size", None) or {}
+        if (
+            "height" not in size or "width" not in size
+            or not getattr(image_processor, "do_resize", False)
+            or not getattr(image_processor, "do_rescale", False)
+            or not getattr(image_processor, "do_normalize", False)
+            or getattr(image_processor, "do_pad", False)
+        ):
+            return False
+
+        self._input_size = (size["height"], size["width"])
+        self._rescale_factor = float(image_processor.rescale_factor)
+        self._image_mean = torch.tensor(image_processor.image_mean, device=self.device).view(1, 3, 1, 1)
+        self._image_std = torch.tensor(image_processor.image_std, device=self.device).view(1, 3, 1, 1)
+        return True
+
+    def _preprocess_on_device(self, image: torch.Tensor) -> torch.Tensor:
+        """Resize, rescale and normalize a (H, W, 3) uint8 device image to pixel_values."""
+        pixel_values = image.permute(2, 0, 1).unsqueeze(0).float()
+        pixel_values = F.interpolate(
+            pixel_values, size=self._input_size, mode="bilinear", align_corners=False, antialias=True
+        )
+        pixel_values.mul_(self._rescale_factor).sub_(self._image_mean).div_(self._image_std)
+        return pixel_values
+
+    def _upload(self, tensor: torch.Tensor) -> torch.Tensor:
+        """Copy a CPU tensor to the device on the copy stream via the pinned staging buffer."""
+        staging = self._pinned_staging
+        if staging is None or staging.shape != tensor.shape or staging.dtype != tensor.dtype:
+            staging = torch.empty_like(tensor, pin_memory=True)
+            self._pinned_staging = staging
+        else:
+            # The previous upload may still be reading the buffer
+            self._copy_stream.synchronize()
+        staging.copy_(tensor)
+        with torch.cuda.stream(self._copy_stream):
+            return staging.to(self.device, non_blocking=True)
+
+    def _compile(self):
+        """
+        Compile the vision encoder and the decoder and pay the cost at load time.
+
+        torch.compile(self.model) would only wrap forward(); get_vision_features
+        would still resolve to the eager bound method. The encoder is therefore
+        compiled on its own: its input is always the processor's fixed size, so
+        one static CUDA graph is recorded. The decoder sees 1..N prompts per call,
+        so it is compiled with dynamic shapes and without CUDA graphs (no
+        re-recording per batch size). Falls back to eager mode on any error.
+        """
+        print("Compiling SAM3 model (one-time warmup, may take a minute)...")
+        self._encode_image = torch.compile(
+            self.model.get_vision_features, mode="reduce-overhead", dynamic=False
+        )
+        self._decode = torch.compile(
+            self.model, mode="max-autotune-no-cudagraphs", dynamic=True
+        )
+        try:
+            # The processor resizes every image to the model's input size, so a
+            # tiny dummy image traces the same graph as real requests
+            dummy = np.zeros((64, 64, 3), dtype=np.uint8)
+            image_inputs = self.processor(images=dummy, return_tensors="pt").to(self.device)
+            with torch.inference_mode(), self._autocast():
+                torch.compiler.cudagraph_mark_step_begin()
+                vision_embeds = self._encode_image(pixel_values=image_inputs.pixel_values)
+                # Two batch sizes, so the decoder settles on its dynamic graph
+                for prompts in (["object"], ["object", "building"]):
+                    text_inputs = self.processor(text=prompts, return_tensors="pt", padding=True).to(self.device)
+                    self._decode(
+                        vision_embeds=_expand_batch(vision_embeds, len(prompts)),
+                        **text_inputs
+                    )
+            self.compiled = True
+            print("✓ SAM3 model compiled")
+        except Exception as e:
+            print(f"torch.compile failed ({e}), using the eager SAM3 model")
+            self._encode_image = self.model.get_vision_features
+            self._decode = self.model
+
+    def warmup(self):
+        """
+        Run one dummy text segmentation through the full request path (upload,
+        preprocessing, encoder, decoder) so CUDA kernels and caches are
+        initialized before the first real request.
+        """
+        try:
+            self.set_image(np.zeros((64, 64, 3), dtype=np.uint8))
+            self.segment_from_text("object")
+        finally:
+            self.current_image = None
+            self.vision_embeds = None
+            self._pixel_values = None
 
     def set_image(self, image: np.ndarray):
         """
@@ -58,9 +248,72 @@ class SAM3TransformersSegmenter:
             image: Image as numpy array (H, W, 3) in RGB format
         """
         self.current_image = image
-        self.current_image_pil = Image.fromarray(image)
+        # Encoded lazily on the first prompt for this image
+        self.vision_embeds = None
+
+        if self.device_preprocess:
+            # Upload the raw uint8 image now; resize/normalize runs on the
+            # GPU right before the encoder (no PIL, no CPU resize)
+            self.original_sizes = [list(image.shape[:2])]
+            self._pixel_values = self._upload(torch.from_numpy(np.ascontiguousarray(image)))
+        else:
+            # Preprocess on the CPU now (the processor takes NumPy arrays
+            # directly) and start the upload asynchronously
+            image_inputs = self.processor(images=image, return_tensors="pt")
+            self.original_sizes = image_inputs.get("original_sizes").tolist()
+            pixel_values = image_inputs.pixel_values
+            if self._copy_stream is not None:
+                pixel_values = self._upload(pixel_values)
+            else:
+                # No CUDA side stream (CPU / MPS): plain synchronous copy
+                pixel_values = pixel_values.to(self.device)
+            self._pixel_values = pixel_values
         print(f"Image set: {image.shape}")
 
+    def _get_vision_embeds(self):
+        """
+        Run the vision encoder on the current image once and cache the result.
+
+        Text prompts only need the (cheap) text encoder and DETR decoder, so
+        every prompt on the same image reuses these features.
+        """
+        if self.vision_embeds is None:
+            pixel_values = self._pixel_values
+            if self._copy_stream is not None:
+                # Wait for the upload started in set_image, and keep the
+                # caching allocator from reusing its memory too early
+                current_stream = torch.cuda.current_stream()
+                current_stream.wait_stream(self._copy_stream)
+                pixel_values.record_stream(current_stream)
+            with torch.inference_mode(), self._autocast():
+                if self.device_preprocess:
+                    pixel_values = self._preprocess_on_device(pixel_values)
+                if self.compiled:
+                    # New CUDA graph replay; the previous image's features are dropped
+                    torch.compiler.cudagraph_mark_step_begin()
+                self.vision_embeds = self._encode_image(pixel_values=pixel_values)
+            # Only the features are needed from here on
+            self._pixel_values = None
+        return self.vision_embeds
+
+    def _get_text_inputs(self, text_prompts: List[str]):
+        """Tokenize a prompt batch and move it to the device, memoized per batch."""
+        key = tuple(text_prompts)
+        text_inputs = self._text_inputs_cache.get(key)
+        if text_inputs is not None:
+            self._text_inputs_cache.move_to_end(key)
+            return text_inputs
+
+        text_inputs = self.processor(
+            text=text_prompts,
+            padding=True,
+            return_tensors="pt"
+        ).to(self.device)
+        self._text_inputs_cache[key] = text_inputs
+        while len(self._text_inputs_cache) > TEXT_INPUT_CACHE_SIZE:
+            self._text_inputs_cache.popitem(last=False)
+        return text_inputs
+
     def segment_from_text(
         self,
         text_prompt: str,
@@ -78,54 +331,91 @@ class SAM3TransformersSegmenter:
         Returns:
             List of segmentation results with masks and metadata
         """
-        if self.current_image_pil is None:
+        return self.segment_from_texts([text_prompt], confidence_threshold, mask_threshold)[0]
+
+    def segment_from_texts(
+        self,
+        text_prompts: List[str],
+        confidence_threshold: float = 0.3,
+        mask_threshold: float = 0.5
+    ) -> List[List[Dict]]:
+        """
+        Segment image with several text prompts in one batched forward pass.
+
+        The cached image features are broadcast over the prompt batch, so the
+        decoder runs once for all prompts.
+
+        Args:
+            text_prompts: Text descriptions (e.g., ["buildings", "trees"])
+            confidence_threshold: Minimum confidence for accepting an object
+            mask_threshold: Threshold for mask binarization
+
+        Returns:
+            One list of segmentation results per prompt, in input order
+        """
+        if self.current_image is None:
             raise ValueError("No image set. Call set_image() first.")
 
-        print(f"Segmenting with text prompt: '{text_prompt}'...")
+        print(f"Segmenting with text prompt(s): {text_prompts}...")
 
-        # Prepare inputs
-        inputs = self.processor(
-            images=self.current_image_pil,
-            text=text_prompt,
-            return_tensors="pt"
-        ).to(self.device)
+        # Image features are computed once per image; only the text is new.
+        # On CUDA the encoder kernels are queued asynchronously, so the
+        # tokenization below already overlaps with the vision forward pass.
+        vision_embeds = self._get_vision_embeds()
+        text_inputs = self._get_text_inputs(text_prompts)
+        if len(text_prompts) > 1:
+            vision_embeds = _expand_batch(vision_embeds, len(text_prompts))
 
         # Run inference
-        with torch.no_grad():
-            outputs = self.model(**inputs)
+        with torch.inference_mode(), self._autocast():
+            outputs = self._decode(vision_embeds=vision_embeds, **text_inputs)
 
         # Post-process results
         results_list = self.processor.post_process_instance_segmentation(
             outputs,
             threshold=confidence_threshold,
             mask_threshold=mask_threshold,
-            target_sizes=inputs.get("original_sizes").tolist()
+            target_sizes=self.original_sizes * len(text_prompts)
         )
 
         # Convert to our internal format
         if not results_list or len(results_list) == 0:
             print("No objects found")
-            return []
+            return [[] for _ in text_prompts]
 
-        results = results_list[0]  # First image
-        masks = results.get('masks', [])
-        boxes = results.get('boxes', [])
-        scores = results.get('scores', [])
+        all_results = []
+        for text_prompt, results in zip(text_prompts, results_list):
+            masks = results.get('masks', [])
+            boxes = results.get('boxes', [])
+            scores = results.get('scores', [])
 
-        print(f"Found {len(masks)} objects matching '{text_prompt}'")
+            print(f"Found {len(masks)} objects matching '{text_prompt}'")
 
-        # Format results
-        formatted_results = []
-        for i, (mask, box, score) in enumerate(zip(masks, boxes, scores)):
-            formatted_results.append({
-                'mask': mask.cpu().numpy(),
-                'box': box.cpu().numpy(),
-                'score': score.item() if torch.is_tensor(score) else score,
-                'class': text_prompt,
-                'id': i
-            })
+            if len(masks) == 0:
+                all_results.append([])
+                continue
 
-        return formatted_results
+            # One device->host copy per field instead of one per object; masks
+            # are binarized to uint8 {0, 1} on the device first (4x fewer
+            # bytes than float32 over PCIe)
+            masks_np = _binary_masks_to_numpy(masks, mask_threshold)
+            boxes_np = _to_numpy_batch(boxes)
+            scores_np = _to_numpy_batch(scores)
+
+            # Format results
+            formatted_results = [
+                {
+                    'mask': masks_np[i],
+                    'box': boxes_np[i],
+                    'score': float(scores_np[i]),
+                    'class': text_prompt,
+                    'id': i
+                }
+                for i in range(len(masks_np))
+            ]
+            all_results.append(formatted_results)
+
+        return all_results
 
     def segment_automatic(self) -> List[Dict]:
         """
@@ -137,38 +427,75 @@ class SAM3TransformersSegmenter:
         Returns:
             List of segmentation results
         """
-        if self.current_image_pil is None:
+        if self.current_image is None:
             raise ValueError("No image set. Call set_image() first.")
 
         print("Performing automatic segmentation...")
 
-        # Try multiple generic prompts to catch different object types
+        # Try multiple generic prompts to catch different object types,
+        # decoded together in a single batched forward pass
         generic_prompts = ["objects", "things", "items"]
-        all_results = []
-        seen_boxes = set()
 
-        for prompt in generic_prompts:
-            try:
-                results = self.segment_from_text(prompt, confidence_threshold=0.3)
-
-                # Deduplicate based on box overlap
-                for result in results:
-                    box = tuple(result['box'].tolist())
-                    if box not in seen_boxes:
-                        seen_boxes.add(box)
-                        all_results.append(result)
-            except Exception as e:
-                print(f"Failed with prompt '{prompt}': {e}")
-                continue
+        try:
+            results_per_prompt = self.segment_from_texts(generic_prompts, confidence_threshold=0.3)
+        except Exception as e:
+            # Fall back to one prompt at a time so a single bad prompt
+            # doesn't lose the others
+            print(f"Batched prompts failed ({e}), retrying one by one...")
+            results_per_prompt = []
+            for prompt in generic_prompts:
+                try:
+                    results_per_prompt.append(self.segment_from_text(prompt, confidence_threshold=0.3))
+                except Exception as e:
+                    print(f"Failed with prompt '{prompt}': {e}")
+                    continue
+
+        candidates = [result for results in results_per_prompt for result in results]
+        all_results = self._deduplicate(candidates)
 
         print(f"Found {len(all_results)} unique objects via automatic segmentation")
         return all_results
 
+    def _deduplicate(self, results: List[Dict]) -> List[Dict]:
+        """
+        Drop objects found by several prompts, keeping the highest scoring one.
+
+        Uses IoU-based NMS over the boxes (torchvision), falling back to exact
+        box equality when torchvision is not installed.
+
+        Args:
+            results: Segmentation results with 'box' and 'score'
+
+        Returns:
+            Deduplicated results (by descending score with NMS)
+        """
+        if not results:
+            return []
+
+        if TORCHVISION_AVAILABLE:
+            boxes = torch.as_tensor(
+                np.stack([r['box'] for r in results]), dtype=torch.float32, device=self.device
+            )
+            scores = torch.as_tensor(
+                [r['score'] for r in results], dtype=torch.float32, device=self.device
+            )
+            keep = nms(boxes, scores, iou_threshold=AUTOMATIC_NMS_IOU)
+            return [results[i] for i in keep.tolist()]
+
+        unique_results = []
+        seen_boxes = set()
+        for result in results:
+            box = tuple(result['box'].tolist())
+            if box not in seen_boxes:
+                seen_boxes.add(box)
+                unique_results.append(result)
+        return unique_results
+
     def mask_to_polygon(
         self,
         mask: np.ndarray,
         simplify_tolerance: float = 1.0
-    ) -> List[List[Tuple[int, int]]]:
+    ) -> List[np.ndarray]:
         """
         Convert binary mask to polygon contours.
 
@@ -177,17 +504,20 @@ class SAM3TransformersSegmenter:
             simplify_tolerance: Tolerance for polygon simplification
 
         Returns:
-            List of polygon contours
+            List of polygon contours, each an (N, 2) int32 vertex array
         """
         # Convert to numpy if needed
         if torch.is_tensor(mask):
             mask = mask.cpu().numpy()
 
-        # Ensure binary mask
+        # Ensure binary uint8 mask in a single pass: uint8 masks (e.g. the
+        # {0, 1} masks from segment_from_text) are used as is, anything else
+        # is thresholded to bool and viewed as uint8 without a copy;
+        # findContours treats any non-zero pixel as foreground
         if mask.dtype != np.uint8:
-            mask = (mask > 0.5).astype(np.uint8) * 255
-        else:
-            mask = (mask > 128).astype(np.uint8) * 255
+            if mask.dtype != np.bool_:
+                mask = mask > 0.5
+            mask = mask.view(np.uint8)
 
         # Find contours
         contours, _ = cv2.findContours(
@@ -201,14 +531,13 @@ class SAM3TransformersSegmenter:
         for contour in contours:
             if len(contour) >= 3:  # Valid polygon needs at least 3 points
                 # Simplify polygon
-                epsilon = simplify_tolerance
-                approx = cv2.approxPolyDP(contour, epsilon, True)
+                approx = cv2.approxPolyDP(contour, simplify_tolerance, True)
 
-                polygon = approx.squeeze().tolist()
-                if isinstance(polygon[0], list):
+                # Keep vertices as an (N, 2) array; list conversion is left
+                # to the JSON serializer (orjson handles NumPy arrays)
+                polygon = approx.reshape(-1, 2)
+                if len(polygon) >= 3:  # Ensure it's still a valid polygon
                     polygons.append(polygon)
-                elif len(polygon) >= 3:
-                    polygons.append([polygon])
 
         return polygons
 
@@ -219,18 +548,24 @@ class SAM3TransformersSegmenter:
             "device": str(self.device),
             "cuda_available": torch.cuda.is_available(),
             "model_loaded": self.model is not None,
+            "compiled": self.compiled,
             "backend": "huggingface_transformers"
         }
 
 
 # Singleton instance
 _sam3_transformers_instance = None
+# Concurrent first calls load (and warm up) the model only once
+_sam3_transformers_lock = threading.Lock()
 
 
 def get_sam3_transformers_instance(model_name: str = "facebook/sam3") -> SAM3TransformersSegmenter:
     """
     Get or create SAM3 Transformers instance (singleton pattern).
 
+    The instance is warmed up before it is published, so on GPU the first
+    real request does not pay for kernel initialization.
+
     Args:
         model_name: Hugging Face model name
 
@@ -239,5 +574,10 @@ def get_sam3_transformers_instance(model_name: str = "facebook/sam3") -> SAM3Tra
     """
     global _sam3_transformers_instance
     if _sam3_transformers_instance is None:
-        _sam3_transformers_instance = SAM3TransformersSegmenter(model_name)
+        with _sam3_transformers_lock:
+            if _sam3_transformers_instance is None:
+                instance = SAM3TransformersSegmenter(model_name)
+                if instance.device != "cpu":
+                    instance.warmup()
+                _sam3_transformers_instance = instance
     return _sam3_transformers_instance
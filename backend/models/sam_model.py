@@ -7,18 +7,81 @@ from PIL import Image
 import cv2
 from typing import List, Tuple, Optional
 import os
+import threading
+
+from models.contours import approx_contours
+
+# Run the ViT image encoder in FP16 / channels_last on CUDA (set to 0 to keep FP32)
+SAM_ENCODER_FP16 = os.getenv("SAM_ENCODER_FP16", "1").lower() in ("1", "true", "yes")
+
+# torch.compile the image encoder (CUDA only); compiling takes about a minute
+# at startup, after which every set_image runs the autotuned kernels
+SAM_COMPILE = os.getenv("SAM_COMPILE", "0").lower() in ("1", "true", "yes")
+
+
+# Share of the (unified) system memory the MPS allocator may use, leaving
+# headroom for the rest of the machine
+MPS_MEMORY_FRACTION = float(os.getenv("MPS_MEMORY_FRACTION", "0.7"))
+_mps_configured = False
+
+
+def default_device(device: Optional[str] = None) -> str:
+    """
+    Resolve the torch device and apply one-time backend settings
+
+    Args:
+        device: Requested device ("cuda", "mps", "cpu"), or None for the best
+            available one: CUDA, then Apple MPS, then CPU
+
+    Returns:
+        Device name
+    """
+    global _mps_configured
+    if device is None:
+        if torch.cuda.is_available():
+            device = "cuda"
+        elif torch.backends.mps.is_available():
+            device = "mps"
+        else:
+            device = "cpu"
+    if device == "mps" and not _mps_configured:
+        torch.mps.set_per_process_memory_fraction(MPS_MEMORY_FRACTION)
+        _mps_configured = True
+    return device
+
+
+class _HalfPrecisionEncoder(torch.nn.Module):
+    """
+    FP16, channels_last wrapper around SAM's image encoder
+
+    Inputs are cast to half precision NHWC for Tensor Core convolutions and
+    matmuls; the embeddings are returned as FP32 so the (small) prompt
+    encoder and mask decoder keep running in full precision.
+    """
+
+    def __init__(self, encoder: torch.nn.Module):
+        super().__init__()
+        self.encoder = encoder.half().to(memory_format=torch.channels_last)
+        # Sam.preprocess and SamPredictor read the input size from here
+        self.img_size = encoder.img_size
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        x = x.half().contiguous(memory_format=torch.channels_last)
+        return self.encoder(x).float()
+
 
 class SAMSegmenter:
-    def __init__(self, model_type: str = "vit_h", checkpoint_path: str = None):
+    def __init__(self, model_type: str = "vit_h", checkpoint_path: str = None, device: Optional[str] = None):
         """
         Initialize SAM model
 
         Args:
             model_type: Model type (vit_h, vit_l, vit_b)
             checkpoint_path: Path to model checkpoint
+            device: Torch device ("cuda", "mps", "cpu"); defaults to SAM_DEVICE,
+                then the best available backend
         """
-        requested_device = os.getenv("SAM_DEVICE")
-        self.device = requested_device or ("cuda" if torch.cuda.is_available() else "cpu")
+        self.device = default_device(device or os.getenv("SAM_DEVICE"))
         self.model_type = model_type
 
         if checkpoint_path is None:
@@ -37,11 +100,53 @@ class SAMSegmenter:
             )
 
         print(f"Loading SAM model ({model_type}) on {self.device}...")
-        self.sam = sam_model_registry[model_type](checkpoint=checkpoint_path)
+        self.sam = sam_model_registry[model_type](checkpoint=None)
+        self.sam.load_state_dict(self._load_checkpoint(checkpoint_path))
         self._move_model_to_device_with_fallback()
+        if self.device == "cuda" and SAM_ENCODER_FP16:
+            self.sam.image_encoder = _HalfPrecisionEncoder(self.sam.image_encoder)
         self.predictor = SamPredictor(self.sam)
+        if self.device == "cuda" and SAM_COMPILE:
+            self._compile_image_encoder()
         print(f"SAM model loaded successfully!")
 
+    def _compile_image_encoder(self):
+        """
+        Compile the image encoder and pay the compile cost with a warmup image
+
+        The encoder always sees a padded 1024x1024 input, so a static-shape
+        graph is compiled once. The mask decoder is left alone: its prompt
+        count varies per call. Falls back to eager mode if compilation fails.
+        """
+        encoder = self.sam.image_encoder
+        self.sam.image_encoder = torch.compile(
+            encoder, mode="max-autotune", dynamic=False, fullgraph=True
+        )
+        print("Compiling SAM image encoder (one-time warmup, may take a minute)...")
+        try:
+            size = encoder.img_size
+            self.predictor.set_image(np.zeros((size, size, 3), dtype=np.uint8))
+            print("SAM image encoder compiled")
+        except Exception as exc:
+            print(f"torch.compile failed ({exc}), using the eager image encoder")
+            self.sam.image_encoder = encoder
+        finally:
+            self.predictor.reset_image()
+
+    @staticmethod
+    def _load_checkpoint(checkpoint_path: str) -> dict:
+        """
+        Load a SAM state dict memory-mapped instead of read into RAM
+
+        mmap lets the weights be copied straight from the page cache into the
+        model (ViT-H is ~2.4 GB), and weights_only skips arbitrary unpickling.
+        """
+        try:
+            return torch.load(checkpoint_path, map_location="cpu", mmap=True, weights_only=True)
+        except TypeError:
+            # torch < 2.1 has no mmap argument
+            return torch.load(checkpoint_path, map_location="cpu")
+
     def _move_model_to_device_with_fallback(self):
         """
         Prefer GPU, but fall back to CPU when the server is already saturated.
@@ -64,6 +169,65 @@ class SAMSegmenter:
         """Set image for segmentation"""
         self.predictor.set_image(image)
 
+    def warmup(self):
+        """
+        Run one dummy click so CUDA kernels, cuDNN algorithm choices and any
+        torch.compile caches are initialized before the first real request
+        """
+        size = self.sam.image_encoder.img_size
+        try:
+            self.set_image(np.zeros((size, size, 3), dtype=np.uint8))
+            self.segment_from_points([(size // 2, size // 2)], [1])
+        finally:
+            self.predictor.reset_image()
+
+    def set_image_batch(self, images: List[np.ndarray], max_batch: int = 4):
+        """
+        Embed several images (e.g. tiles of one scene) with batched encoder passes
+
+        The ViT encoder runs once per `max_batch` images instead of once per
+        image. Use `select_batch_image` (or `segment_from_box(..., image_index=i)`)
+        to point the prompt decoder at one of them.
+
+        Args:
+            images: Images as numpy arrays (H, W, 3) in RGB format
+            max_batch: Images per encoder pass (bounds activation memory)
+        """
+        transform = self.predictor.transform
+        device = self.predictor.device
+
+        inputs = []
+        self.batch_original_sizes = []
+        self.batch_input_sizes = []
+        for image in images:
+            # Same preprocessing as SamPredictor.set_image: resize the longest
+            # side to 1024, then normalize and pad to a square in sam.preprocess
+            resized = transform.apply_image(image)
+            image_torch = torch.as_tensor(resized, device=device).permute(2, 0, 1).contiguous()
+            self.batch_original_sizes.append(image.shape[:2])
+            self.batch_input_sizes.append(tuple(image_torch.shape[-2:]))
+            inputs.append(self.sam.preprocess(image_torch[None]))
+
+        features = []
+        with torch.no_grad():
+            for start in range(0, len(inputs), max_batch):
+                features.append(self.sam.image_encoder(torch.cat(inputs[start:start + max_batch])))
+        self.features_batch = torch.cat(features)
+
+    def select_batch_image(self, image_index: int):
+        """
+        Use one image embedded by `set_image_batch` for subsequent prompts
+
+        Args:
+            image_index: Index into the list passed to `set_image_batch`
+        """
+        predictor = self.predictor
+        predictor.reset_image()
+        predictor.features = self.features_batch[image_index:image_index + 1]
+        predictor.original_size = self.batch_original_sizes[image_index]
+        predictor.input_size = self.batch_input_sizes[image_index]
+        predictor.is_image_set = True
+
     def segment_from_points(
         self,
         points: List[Tuple[float, float]],
@@ -81,35 +245,129 @@ class SAMSegmenter:
         Returns:
             Binary mask of segmentation
         """
-        point_coords = np.array(points)
-        point_labels = np.array(labels)
+        mask = self.segment_from_points_torch(
+            torch.as_tensor(np.asarray(points, dtype=np.float32)),
+            torch.as_tensor(np.asarray(labels, dtype=np.int32)),
+            multimask_output=multimask_output,
+        )
+        return mask.cpu().numpy()
 
-        masks, scores, logits = self.predictor.predict(
-            point_coords=point_coords,
-            point_labels=point_labels,
+    def segment_from_points_torch(
+        self,
+        point_coords: torch.Tensor,
+        point_labels: torch.Tensor,
+        multimask_output: bool = True
+    ) -> torch.Tensor:
+        """
+        Segment image based on point prompts given as tensors
+
+        Tensors already on the model's device (e.g. streamed from an
+        interactive client) skip the NumPy staging and host->device copy of
+        SamPredictor.predict; the mask stays on the device.
+
+        Args:
+            point_coords: (N, 2) tensor of (x, y) coordinates in original image pixels
+            point_labels: (N,) tensor of labels (1 for foreground, 0 for background)
+            multimask_output: If True, returns best of 3 masks; if False, returns 1 mask
+
+        Returns:
+            Binary (H, W) bool mask tensor on the model's device
+        """
+        device = self.predictor.device
+        coords = self.predictor.transform.apply_coords_torch(
+            point_coords.to(device=device, dtype=torch.float),
+            self.predictor.original_size,
+        )
+        labels = point_labels.to(device=device, dtype=torch.int)
+
+        masks, scores, _ = self.predictor.predict_torch(
+            point_coords=coords[None],
+            point_labels=labels[None],
+            boxes=None,
             multimask_output=multimask_output,
         )
+        masks, scores = masks[0], scores[0]
 
         # Return the mask with highest score
         if multimask_output:
-            best_mask_idx = np.argmax(scores)
-            return masks[best_mask_idx]
-        else:
-            return masks[0]
+            return masks[scores.argmax()]
+        return masks[0]
+
+    def segment_from_points_batch(
+        self,
+        points_list: List[List[Tuple[float, float]]],
+        labels_list: List[List[int]],
+        multimask_output: bool = True,
+        max_batch: int = 16
+    ) -> List[np.ndarray]:
+        """
+        Segment several objects on the current image with batched decoder passes
+
+        Prompt sets are padded to the same length with label -1 (SAM's
+        "not a point" marker) and decoded together by `predict_torch`, so N
+        objects cost ceil(N / max_batch) decoder calls instead of N.
+
+        Args:
+            points_list: One list of (x, y) coordinates per object
+            labels_list: One list of labels per object (1 foreground, 0 background)
+            multimask_output: If True, keeps the best of 3 masks per object
+            max_batch: Objects per decoder pass (bounds full-resolution mask memory)
+
+        Returns:
+            One binary mask per object, in input order
+        """
+        transform = self.predictor.transform
+        original_size = self.predictor.original_size
+        device = self.predictor.device
+
+        results = []
+        for start in range(0, len(points_list), max_batch):
+            batch_points = points_list[start:start + max_batch]
+            batch_labels = labels_list[start:start + max_batch]
+            max_points = max(len(points) for points in batch_points)
+
+            coords = np.zeros((len(batch_points), max_points, 2), dtype=np.float64)
+            labels = np.full((len(batch_points), max_points), -1, dtype=np.int64)
+            for i, (points, point_labels) in enumerate(zip(batch_points, batch_labels)):
+                coords[i, :len(points)] = points
+                labels[i, :len(point_labels)] = point_labels
+
+            coords = transform.apply_coords(coords, original_size)
+            masks, scores, _ = self.predictor.predict_torch(
+                point_coords=torch.as_tensor(coords, dtype=torch.float, device=device),
+                point_labels=torch.as_tensor(labels, dtype=torch.int, device=device),
+                multimask_output=multimask_output,
+            )
+
+            # Keep the highest scoring mask per object
+            if multimask_output:
+                best = scores.argmax(dim=1)
+                masks = masks[torch.arange(masks.shape[0], device=masks.device), best]
+            else:
+                masks = masks[:, 0]
+            results.extend(masks.cpu().numpy())
+
+        return results
 
     def segment_from_box(
         self,
-        box: Tuple[float, float, float, float]
+        box: Tuple[float, float, float, float],
+        image_index: Optional[int] = None
     ) -> np.ndarray:
         """
         Segment image based on bounding box
 
         Args:
             box: Bounding box as (x_min, y_min, x_max, y_max)
+            image_index: Optional index of an image embedded by `set_image_batch`
+                (defaults to the current image)
 
         Returns:
             Binary mask of segmentation
         """
+        if image_index is not None:
+            self.select_batch_image(image_index)
+
         box_np = np.array(box)
         masks, scores, logits = self.predictor.predict(
             box=box_np,
@@ -121,7 +379,7 @@ class SAMSegmenter:
         self,
         mask: np.ndarray,
         simplify_tolerance: float = 1.0
-    ) -> List[List[Tuple[int, int]]]:
+    ) -> List[np.ndarray]:
         """
         Convert binary mask to polygon contours
 
@@ -130,10 +388,14 @@ class SAMSegmenter:
             simplify_tolerance: Tolerance for polygon simplification (higher = simpler)
 
         Returns:
-            List of polygon contours
+            List of polygon contours, each an (N, 2) int32 vertex array
         """
-        # Convert mask to uint8
-        mask_uint8 = (mask * 255).astype(np.uint8)
+        # Convert mask to uint8 (bool masks are viewed in place, no copy;
+        # findContours treats any non-zero pixel as foreground)
+        if mask.dtype == np.bool_:
+            mask_uint8 = mask.view(np.uint8)
+        else:
+            mask_uint8 = (mask * 255).astype(np.uint8)
 
         # Find contours
         contours, _ = cv2.findContours(
@@ -142,19 +404,15 @@ class SAMSegmenter:
             cv2.CHAIN_APPROX_SIMPLE
         )
 
-        # Convert contours to list of points
+        # Simplify polygons to reduce point count and convert them to
+        # vertex arrays
         polygons = []
-        for contour in contours:
-            if len(contour) >= 3:  # Valid polygon needs at least 3 points
-                # Simplify polygon to reduce point count
-                epsilon = simplify_tolerance
-                approx = cv2.approxPolyDP(contour, epsilon, True)
-
-                polygon = approx.squeeze().tolist()
-                if isinstance(polygon[0], list):
-                    polygons.append(polygon)
-                elif len(polygon) >= 3:  # Ensure it's still a valid polygon
-                    polygons.append([polygon])
+        for approx in approx_contours(contours, simplify_tolerance):
+            # Keep vertices as an (N, 2) array; list conversion is left
+            # to the JSON serializer (orjson handles NumPy arrays)
+            polygon = approx.reshape(-1, 2)
+            if len(polygon) >= 3:  # Ensure it's still a valid polygon
+                polygons.append(polygon)
 
         return polygons
 
@@ -170,10 +428,23 @@ class SAMSegmenter:
 
 # Singleton instance
 _sam_instance = None
+# Concurrent first calls load (and warm up) the model only once
+_sam_lock = threading.Lock()
 
 def get_sam_instance(model_type: str = "vit_h", checkpoint_path: str = None) -> SAMSegmenter:
-    """Get or create SAM instance"""
+    """
+    Get or create SAM instance
+
+    The instance is warmed up before it is published, so on GPU the first
+    real request does not pay for kernel/compile initialization; this runs
+    wherever the model is loaded (at startup with PRELOAD_MODELS)
+    """
     global _sam_instance
     if _sam_instance is None:
-        _sam_instance = SAMSegmenter(model_type, checkpoint_path)
+        with _sam_lock:
+            if _sam_instance is None:
+                instance = SAMSegmenter(model_type, checkpoint_path)
+                if instance.device != "cpu":
+                    instance.warmup()
+                _sam_instance = instance
     return _sam_instance
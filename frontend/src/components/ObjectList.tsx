@@ -166,7 +166,7 @@ const ObjectList: React.FC<ObjectListProps> = ({
               {/* Thumbnail */}
               {obj.properties.thumbnail ? (
                 <img
-                  src={`data:image/png;base64,${obj.properties.thumbnail}`}
+                  src={`data:image/webp;base64,${obj.properties.thumbnail}`}
                   alt={`Object ${index + 1}`}
                   className="object-thumbnail"
                 />